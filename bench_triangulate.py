@@ -0,0 +1,37 @@
+# Benchmark of the planar Delaunay triangulation (he.Mesh.triangulate)
+# Waldemar Celes
+# Tecgraf Institute of PUC-Rio
+# celes@tecgraf.puc-rio.br
+
+# Triangulates uniformly distributed random points in the unit square and reports
+# the construction time, the number of flips to restore the Delaunay condition
+# and the time to check the Delaunay condition of all edges.
+
+from ds import he
+import numpy as np
+import time
+import sys
+
+def bench (n, seed=0):
+  rng = np.random.default_rng(seed)
+  X = rng.random(n)
+  Y = rng.random(n)
+  m = he.Mesh()
+  t0 = time.time()
+  flips = m.triangulate(X,Y)
+  t1 = time.time()
+  legal = m.e_legal_batch()
+  t2 = time.time()
+  return {'points': n, 'triangles': len(m.T), 'flips': flips,
+          'triangulate': t1 - t0, 'check': t2 - t1, 'delaunay': bool(legal.all())}
+
+def main():
+  sizes = [int(float(a)) for a in sys.argv[1:]] or [10**4, 10**5, 10**6]
+  print("%10s %10s %8s %12s %10s %9s" % ("points","triangles","flips","triangulate","check","delaunay"))
+  for n in sizes:
+    r = bench(n)
+    print("%10d %10d %8d %11.2fs %9.2fs %9s" % (r['points'],r['triangles'],r['flips'],
+          r['triangulate'],r['check'],r['delaunay']))
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,297 @@
+# embed: cached 3d embedding of the vertices of intrinsic triangulations
+# Waldemar Celes
+# Tecgraf Institute of PUC-Rio
+# celes@tecgraf.puc-rio.br
+
+# This is an auxiliary class that keeps, for every intrinsic vertex, its containing extrinsic
+# triangle and its barycentric coordinates (in the order of te_flatten), and thus its 3d point.
+# The locations are computed in batch (v_locations) and then updated incrementally: the mesh
+# notifies the modified vertices (as for live matrices) and only the inserted vertices among
+# them are located again, when the embedding is requested.
+# An inserted vertex adjacent to an extrinsic vertex is located by tracing the intrinsic edge
+# from the extrinsic vertex: its direction is given by the supporting information, and the
+# straight line is followed across the unfolded extrinsic triangles. The other vertices are
+# searched in the overlapping triangles of the extrinsic triangles around their neighbors.
+# The locations also define a sparse prolongation matrix, which interpolates values given at
+# the extrinsic vertices to all intrinsic vertices.
+
+import math
+import numpy as np
+import scipy
+from . import utl
+
+MAX_RINGS = 3     # rings of extrinsic triangles searched around the neighbors of a vertex
+MAX_STEPS = 10000 # maximum number of extrinsic triangles crossed by a trace
+
+class Embedding:
+  def __init__ (self, mesh):
+    self.mesh = mesh
+    self.te = []            # extrinsic triangle of each vertex (-1 if not located)
+    self.bary = []          # barycentric coordinates w.r.t. the extrinsic triangle: [b0,b1,b2]
+    self.pending = set()    # vertices modified since the last update
+    self.full = True        # request the location of all vertices
+    self.version = 0        # incremented each time the embedding changes
+    self.stats = {'traced': 0, 'searched': 0, 'full': 0}  # number of located vertices per method
+    self.P = None           # cached prolongation matrix (see prolongation)
+    self.pversion = -1      # version of the embedding used by the prolongation matrix
+    # vertices of each extrinsic triangle (in the order of te_flatten)
+    HE = mesh.HE
+    self.tv = np.array([[HE.H[h][0] for h in mesh.te_halfedges(t)] for t in range(len(HE.T))],
+                       dtype='int64').reshape(-1,3)
+    mesh.observers.append(self)
+
+  # register modified vertices
+  def touch (self, vlist):
+    self.pending.update(vlist)
+
+  # request the location of all vertices
+  def reset (self):
+    self.full = True
+
+  # return the up to date locations: extrinsic triangles (n) and barycentric coordinates (n x 3)
+  def locations (self):
+    self.update()
+    return np.array(self.te,dtype='int64'), np.array(self.bary,dtype='float64').reshape(-1,3)
+
+  # return the up to date 3d positions of the vertices (n x 3)
+  def positions (self):
+    return self.prolongation() @ np.array(self.mesh.HE.C,dtype='float64').reshape(-1,3)
+
+  # return the up to date prolongation matrix (n x ne, csr format): each row interpolates the
+  # values at the extrinsic vertices with the barycentric coordinates of an intrinsic vertex
+  # (unlocated vertices have empty rows); the matrix is rebuilt only if the embedding changed
+  def prolongation (self):
+    te, bary = self.locations()
+    if self.pversion != self.version:
+      ok = np.nonzero(te != -1)[0]
+      I = np.repeat(ok,3)
+      J = self.tv[te[ok]].ravel()
+      X = bary[ok].ravel()
+      self.P = scipy.sparse.csr_matrix((X,(I,J)),shape=(len(te),len(self.mesh.HE.V)))
+      self.P.eliminate_zeros()
+      self.pversion = self.version
+    return self.P
+
+  # locate the vertices affected by the pending modifications
+  def update (self):
+    mesh = self.mesh
+    n = len(mesh.V)
+    if self.full:
+      self.te, self.bary = mesh.v_locations()
+      self.stats['full'] += 1
+      self.pending.clear()
+      self.full = False
+      self.version += 1
+      return
+    if len(self.te) < n:
+      self.pending.update(range(len(self.te),n))
+      self.te += [-1] * (n-len(self.te))
+      self.bary += [[0.0,0.0,0.0] for i in range(n-len(self.bary))]
+    ne = len(mesh.HE.V)
+    vlist = sorted(v for v in self.pending if ne <= v < n)
+    self.pending.clear()
+    if not vlist:
+      return
+    mesh.repair_support()
+    for v in vlist:
+      self.te[v] = -1
+    rest = []
+    for v in vlist:
+      loc = self.trace_from_extrinsic(v)
+      if loc:
+        self.te[v], self.bary[v] = loc
+        self.stats['traced'] += 1
+      else:
+        rest.append(v)
+    if rest:
+      self.search(rest)
+    self.version += 1
+
+  # locate a vertex by tracing its shortest edge to an extrinsic vertex
+  # return the extrinsic triangle and the barycentric coordinates, or None
+  def trace_from_extrinsic (self, v):
+    mesh = self.mesh
+    ne = len(mesh.HE.V)
+    best = None
+    for h in mesh.adj_vh(v):
+      g = mesh.previous(h)   # halfedge arriving at v
+      if mesh.H[g][0] < ne:
+        l = mesh.L[mesh.H[g][1]]
+        if best == None or l < best[0]:
+          best = (l,g)
+    if best == None:
+      return None
+    return self.trace(best[1])
+
+  # trace an intrinsic halfedge from its (extrinsic) origin
+  # return the extrinsic triangle and the barycentric coordinates of its end, or None
+  def trace (self, g):
+    mesh = self.mesh
+    anchor = mesh.v_anchor(mesh.H[g][0])
+    if anchor == None:
+      return None
+    x, s, phi = anchor
+    phi = self.star_angle(s,phi,g)
+    if phi == None:
+      return None
+    return self.trace_ray(x,phi,mesh.L[mesh.H[g][1]])
+
+  # return the angle of the intrinsic halfedge g w.r.t. the extrinsic halfedge of the
+  # supporting information (s, phi), rotating around their origin; None if not reached
+  def star_angle (self, s, phi, g):
+    mesh = self.mesh
+    h = s
+    a = phi
+    while h != g:   # counterclockwise
+      a += mesh.h_angle(h)
+      h = mesh.mate(mesh.previous(h))
+      if h == -1 or h == s:
+        break
+    if h == g:
+      return a
+    h = s
+    a = phi
+    while h != g:   # clockwise (vertex on border)
+      m = mesh.mate(h)
+      if m == -1:
+        return None
+      h = mesh.next(m)
+      a -= mesh.h_angle(h)
+      if h == s:
+        return None
+    return a
+
+  # follow a straight line from the origin of the extrinsic halfedge x, with angle phi w.r.t.
+  # x and the given length, across the unfolded extrinsic triangles
+  # return the extrinsic triangle and the barycentric coordinates of the end point, or None
+  def trace_ray (self, x, phi, length):
+    HE = self.mesh.HE
+    # find the extrinsic wedge that contains the direction
+    for i in range(MAX_STEPS):
+      if phi < 0:
+        m = HE.mate(x)
+        if m == -1:
+          return None
+        x = HE.next(m)
+        phi += HE.h_angle(x)
+      elif phi > HE.h_angle(x):
+        phi -= HE.h_angle(x)
+        x = HE.mate(HE.previous(x))
+        if x == -1:
+          return None
+      else:
+        break
+    hs = [x,HE.next(x),HE.previous(x)]
+    p0 = [0.0,0.0]
+    p1 = [HE.distance(HE.H[hs[0]][0],HE.H[hs[1]][0]),0.0]
+    pts = [p0,p1,self.unfold(hs[0],p0,p1)]
+    q = [length*math.cos(phi),length*math.sin(phi)]
+    entry = None   # index of the entry edge (None: the trace starts at vertex 0)
+    for step in range(MAX_STEPS):
+      o = [utl.orient(pts[i],pts[(i+1)%3],q) for i in range(3)]
+      if min(o) >= 0:
+        break
+      # exit edge: q is on its outer side and the line crosses it
+      out = None
+      for i in range(3):
+        if i == entry or (entry == None and i != 1):
+          continue
+        if o[i] < 0 and (out == None or utl.crossing_margin(pts[i],pts[(i+1)%3],p0,q) >
+                                          utl.crossing_margin(pts[out],pts[(out+1)%3],p0,q)):
+          out = i
+      if out == None:
+        break  # end point on the border of the triangle (up to rounding)
+      m = HE.mate(hs[out])
+      if m == -1:
+        return None
+      a = pts[(out+1)%3]
+      b = pts[out]
+      hs = [m,HE.next(m),HE.previous(m)]
+      pts = [a,b,self.unfold(m,a,b)]
+      entry = 0
+    else:
+      return None
+    area = utl.orient(pts[0],pts[1],pts[2])
+    w = [utl.orient(pts[1],pts[2],q)/area,utl.orient(pts[2],pts[0],q)/area,0.0]
+    w[2] = 1 - w[0] - w[1]
+    te = HE.H[hs[0]][2]
+    order = self.mesh.te_halfedges(te)
+    b = [0.0,0.0,0.0]
+    for k in range(3):
+      b[order.index(hs[k])] = w[k]
+    return te, b
+
+  # return the position of the vertex opposite to the extrinsic halfedge h, whose
+  # origin and target are at the 2d points a and b (the triangle is on the left side)
+  def unfold (self, h, a, b):
+    HE = self.mesh.HE
+    v0 = HE.H[h][0]
+    v1 = HE.H[HE.next(h)][0]
+    v2 = HE.H[HE.previous(h)][0]
+    l0 = math.hypot(b[0]-a[0],b[1]-a[1])
+    l1 = HE.distance(v1,v2)
+    l2 = HE.distance(v2,v0)
+    s = (l0*l0 + l2*l2 - l1*l1) / (2*l0)
+    t = math.sqrt(max(l2*l2 - s*s,0.0))
+    d = [(b[0]-a[0])/l0,(b[1]-a[1])/l0]
+    return [a[0] + s*d[0] - t*d[1], a[1] + s*d[1] + t*d[0]]
+
+  # locate vertices in the overlapping triangles of the extrinsic triangles around their neighbors
+  def search (self, vlist):
+    mesh = self.mesh
+    tset = set()
+    for v in vlist:
+      for h in mesh.adj_vh(v):
+        for u in (mesh.H[mesh.next(h)][0],mesh.H[mesh.previous(h)][0]):
+          if self.te[u] != -1:
+            tset.add(self.te[u])
+    rest = set(vlist)
+    score = {v: -math.inf for v in vlist}
+    mark = [-1 for i in range(0,len(mesh.T))]
+    done = set()
+    for ring in range(MAX_RINGS+1):
+      for te in tset - done:
+        ce = mesh.te_flatten(te)
+        for t, p, h in mesh.collect_overlapping_triangles(te,ce,mark):
+          for k in range(3):
+            v = mesh.H[h][0]
+            h = mesh.next(h)
+            if v not in rest:
+              continue
+            uv = mesh.to_baricentric(ce,[p[k]])[0]
+            b = [uv[0],uv[1],1-uv[0]-uv[1]]
+            if min(b) > score[v]:
+              score[v] = min(b)
+              self.te[v] = te
+              self.bary[v] = b
+      done |= tset
+      for v in list(rest):
+        if score[v] > -1e-9:
+          rest.discard(v)
+          self.stats['searched'] += 1
+      if not rest:
+        return
+      tset = self.te_ring(tset)
+    # not found around the neighbors: locate all vertices again
+    self.full = True
+    self.update()
+
+  # return the extrinsic triangles that share a vertex with the given ones
+  def te_ring (self, tset):
+    HE = self.mesh.HE
+    ring = set(tset)
+    for te in tset:
+      for h0 in self.mesh.te_halfedges(te):
+        h = h0
+        while True:   # counterclockwise
+          ring.add(HE.H[h][2])
+          h = HE.mate(HE.previous(h))
+          if h == -1 or h == h0:
+            break
+        if h == -1:
+          m = HE.mate(h0)
+          while m != -1:   # clockwise
+            h = HE.next(m)
+            ring.add(HE.H[h][2])
+            m = HE.mate(h)
+    return ring
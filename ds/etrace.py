@@ -0,0 +1,201 @@
+# etrace: tracing of intrinsic edges over the extrinsic mesh
+# Waldemar Celes
+# Tecgraf Institute of PUC-Rio
+# celes@tecgraf.puc-rio.br
+
+# This is an auxiliary class that traces the intrinsic edges as 3d polylines over the
+# extrinsic mesh. For each extrinsic triangle, the overlapping intrinsic triangles are laid out
+# in its 2d frame (as in the common subdivision, see collect_overlapping_triangles) and each
+# intrinsic edge is clipped against the triangle; the pieces of an edge, from all extrinsic
+# triangles it crosses, are sorted by their parameter along the edge.
+# Polylines are cached per edge. The mesh notifies the modified vertices (swapedge, t_refine,
+# e_refine, vertex_displacement) and the edges around them are traced again, on demand,
+# in the extrinsic triangles they used to cross (the search grows by rings of extrinsic
+# triangles until the traced pieces cover the whole edge).
+
+import math
+import numpy as np
+from . import utl
+
+MAX_RINGS = 3   # rings of extrinsic triangles added to complete the incremental traces
+GAP = 1e-9      # maximum gap between pieces of a polyline (relative to the edge length)
+
+class EdgeTracer:
+  def __init__ (self, mesh):
+    self.mesh = mesh
+    self.lines = []         # polyline of each edge: list of k points (None if not traced)
+    self.tlist = []         # extrinsic triangles crossed by each edge
+    self.pending = set()    # vertices modified since the last update
+    self.full = True        # request the tracing of all edges
+    self.version = 0        # incremented each time the polylines change
+    self.stats = {'edges': 0, 'triangles': 0, 'full': 0}  # traced edges and extrinsic triangles
+    mesh.observers.append(self)
+
+  # register modified vertices
+  def touch (self, vlist):
+    self.pending.update(vlist)
+
+  # request the tracing of all edges
+  def reset (self):
+    self.full = True
+
+  # return the up to date polyline of an edge (array k x 3, from the origin of its first halfedge)
+  # or None if the edge could not be traced
+  def polyline (self, e):
+    self.update()
+    line = self.lines[e]
+    if line == None:
+      return None
+    return np.array(line,dtype='float64').reshape(-1,3)
+
+  # return the up to date polylines of all edges in flat arrays:
+  # offsets (|E|+1) and points (n x 3); the points of edge e are points[offsets[e]:offsets[e+1]]
+  def polylines (self):
+    self.update()
+    lines = [l if l != None else [] for l in self.lines]  # untraced edges are empty
+    sizes = np.array([len(l) for l in lines],dtype='int64')
+    offsets = np.zeros(len(sizes)+1,dtype='int64')
+    np.cumsum(sizes,out=offsets[1:])
+    points = np.array([p for l in lines for p in l],dtype='float64').reshape(-1,3)
+    return offsets, points
+
+  # trace the edges affected by the pending modifications
+  def update (self):
+    mesh = self.mesh
+    ne = len(mesh.E)
+    if self.full:
+      self.lines = [None] * ne
+      self.tlist = [[] for e in range(ne)]
+      self.trace(range(len(mesh.HE.T)),set(range(ne)),{e: [] for e in range(ne)})
+      self.stats['full'] += 1
+      self.pending.clear()
+      self.full = False
+      self.version += 1
+      return
+    if len(self.lines) < ne:
+      self.lines += [None] * (ne-len(self.lines))
+      self.tlist += [[] for e in range(ne-len(self.tlist))]
+    eset = set(e for e in range(ne) if self.lines[e] == None)
+    for v in self.pending:
+      if v < len(mesh.V):
+        for h in mesh.adj_vh(v):
+          eset.add(mesh.H[h][1])
+          eset.add(mesh.H[mesh.previous(h)][1])
+    self.pending.clear()
+    if not eset:
+      return
+    # extrinsic triangles crossed before, and around the edge end points
+    tset = set()
+    for e in eset:
+      tset.update(self.tlist[e])
+      self.tlist[e] = []
+    emb = mesh.get_embedding()
+    te, _ = emb.locations()
+    for e in eset:
+      h = mesh.E[e][0]
+      for v in (mesh.H[h][0],mesh.H[mesh.next(h)][0]):
+        if te[v] != -1:
+          tset.add(int(te[v]))
+    done = set()
+    rest = set(eset)
+    pieces = {e: [] for e in eset}
+    for ring in range(MAX_RINGS+1):
+      rest = self.trace(tset-done,rest,pieces)
+      done |= tset
+      if not rest:
+        break
+      tset = emb.te_ring(tset)
+    if rest:
+      # not completed around the edges: trace all edges again
+      self.full = True
+      self.update()
+      return
+    self.version += 1
+
+  # trace the edges in eset over the given extrinsic triangles, accumulating their pieces
+  # (s0, s1, p0, p1) in the pieces dictionary; return the edges that are still not completed
+  def trace (self, tset, eset, pieces):
+    mesh = self.mesh
+    HE = mesh.HE
+    mark = [-1 for i in range(0,len(mesh.T))]
+    for te in tset:
+      self.stats['triangles'] += 1
+      ce = mesh.te_flatten(te)
+      c = [HE.C[HE.H[h][0]] for h in mesh.te_halfedges(te)]
+      for t, p, h0 in mesh.collect_overlapping_triangles(te,ce,mark):
+        h = h0
+        for k in range(3):
+          e = mesh.H[h][1]
+          if e in eset and mesh.E[e][0] == h:
+            piece = clip(ce,p[k],p[(k+1)%3])
+            if piece:
+              s0, s1 = piece
+              a = lerp(p[k],p[(k+1)%3],s0)
+              b = lerp(p[k],p[(k+1)%3],s1)
+              pieces[e].append((s0,s1,to_3d(ce,c,a),to_3d(ce,c,b)))
+              if te not in self.tlist[e]:
+                self.tlist[e].append(te)
+          h = mesh.next(h)
+    rest = set()
+    for e in eset:
+      line = assemble(pieces[e])
+      self.lines[e] = line
+      if line == None:
+        rest.add(e)
+      else:
+        self.stats['edges'] += 1
+    return rest
+
+# join the pieces (s0, s1, p0, p1) of an edge, sorted by parameter
+# return the polyline (list of points), or None if the pieces do not cover the edge
+def assemble (pieces):
+  pieces = sorted(pieces,key=lambda x: (x[0],x[1]))
+  if not pieces or pieces[0][0] > GAP:
+    return None
+  points = [pieces[0][2]]
+  smax = 0.0
+  for s0, s1, p0, p1 in pieces:
+    if s0 > smax + GAP:
+      return None
+    if s1 > smax + GAP:
+      points.append(p1)
+      smax = s1
+  if smax < 1 - GAP:
+    return None
+  return points
+
+# clip the segment a-b against the triangle ce (counterclockwise)
+# return the parameter interval (s0, s1) inside the triangle, or None
+def clip (ce, a, b):
+  s0 = 0.0
+  s1 = 1.0
+  for i in range(3):
+    p = ce[i]
+    q = ce[(i+1)%3]
+    fa = utl.orient(p,q,a)
+    fb = utl.orient(p,q,b)
+    tol = 1e-12 * math.hypot(q[0]-p[0],q[1]-p[1]) * (math.hypot(b[0]-a[0],b[1]-a[1]) +
+                                                    math.hypot(q[0]-p[0],q[1]-p[1]))
+    if fa < -tol and fb < -tol:
+      return None
+    if fa < -tol:
+      s0 = max(s0,fa/(fa-fb))
+    elif fb < -tol:
+      s1 = min(s1,fa/(fa-fb))
+  if s1 - s0 <= GAP:
+    return None
+  return s0, s1
+
+# point at parameter s of segment a-b
+def lerp (a, b, s):
+  return [a[0] + s*(b[0]-a[0]), a[1] + s*(b[1]-a[1])]
+
+# map a 2d point in the frame of an extrinsic triangle (ce) to 3d (c: vertex coordinates)
+def to_3d (ce, c, p):
+  area = utl.orient(ce[0],ce[1],ce[2])
+  w0 = utl.orient(p,ce[1],ce[2]) / area
+  w1 = utl.orient(ce[0],p,ce[2]) / area
+  w2 = 1 - w0 - w1
+  return [w0*c[0][0] + w1*c[1][0] + w2*c[2][0],
+          w0*c[0][1] + w1*c[1][1] + w2*c[2][1],
+          w0*c[0][2] + w1*c[1][2] + w2*c[2][2]]
@@ -8,6 +8,7 @@
 
 import math
 import numpy as np
+import scipy
 import random as rd
 from . import utl
 
@@ -67,8 +68,10 @@ class Mesh:
     self.E = []  # the two halfedge indices that form the edge: [he0,he1]
     self.T = []  # one halfedge index associated to the triangle: he
     self.H = []  # vertex, edge, triangle, and next halfedge associated to halfedge: [v,e,t,he]
-    for c in C:
-      self.addvertex(c[0],c[1],c[2])
+    if len(C) > 0:
+      # add all vertices at once
+      self.C = np.asarray(C,dtype='float64').reshape(len(C),-1)[:,0:3].tolist()
+      self.V = [-1] * len(self.C)
     if len(I) > 0:
       self.sew(I)
 
@@ -90,39 +93,46 @@ class Mesh:
       v = len(self.V)
       self.C.append([x,y,z])
       self.V.append(-1)
+    return v
 
   # sew the data structure considering all the triangles at once
+  # the connectivity is built in bulk: halfedges are matched by sorting their vertex pairs
   def sew (self, I):
-    T = [] # temporary list of edges
+    I = np.asarray(I,dtype='int64').reshape(-1,3)
+    nt = len(I)
+    h0 = len(self.H)
+    t0 = len(self.T)
+    e0 = len(self.E)
     # create halfedges (still, without edges)
-    for i,t in enumerate(I):
-      h = len(self.H)
-      self.H.append([t[0],None,i,h+1])
-      self.H.append([t[1],None,i,h+2])
-      self.H.append([t[2],None,i,h])
-      self.V[t[0]] = h
-      self.V[t[1]] = h+1
-      self.V[t[2]] = h+2
-      self.T.append(h)
-      appendedge(T,t[0],t[1],h,i)
-      appendedge(T,t[1],t[2],h+1,i)
-      appendedge(T,t[2],t[0],h+2,i)
-    T.sort(key = lambda x : (x[0],x[1]))
-    i = 0
-    while i < len(T):
-      if i+1 < len(T) and T[i][0] == T[i+1][0] and T[i][1] == T[i+1][1]:
-        e = len(self.E)
-        self.E.append([T[i][2],T[i+1][2]])
-        self.H[T[i][2]][1] = e
-        self.H[T[i+1][2]][1] = e
-        if i+2 < len(T) and T[i][0] == T[i+2][0] and T[i][1] == T[i+2][1]:
-          raise("More than two uses per edge")
-        i += 2
-      else:
-        e = len(self.E)
-        self.E.append([T[i][2],-1])
-        self.H[T[i][2]][1] = e
-        i += 1
+    h = np.arange(3*nt).reshape(-1,3)
+    H = np.empty((3*nt,4),dtype='int64')
+    H[:,0] = I.ravel()
+    H[:,2] = np.repeat(np.arange(nt),3) + t0
+    H[:,3] = h[:,[1,2,0]].ravel() + h0
+    # match halfedges of the same edge: sort by (vmin,vmax), keeping the halfedge order
+    v0 = I.ravel()
+    v1 = I[:,[1,2,0]].ravel()
+    order = np.lexsort((np.maximum(v0,v1),np.minimum(v0,v1)))
+    a = np.minimum(v0,v1)[order]
+    b = np.maximum(v0,v1)[order]
+    first = np.ones(len(order),dtype=bool)
+    first[1:] = (a[1:] != a[:-1]) | (b[1:] != b[:-1])
+    start = np.nonzero(first)[0]
+    count = np.diff(np.append(start,len(order)))
+    if np.any(count > 2):
+      raise ValueError("More than two uses per edge")
+    E = np.full((len(start),2),-1,dtype='int64')
+    E[:,0] = order[start] + h0
+    E[count == 2,1] = order[start[count == 2] + 1] + h0
+    H[order,1] = np.repeat(np.arange(len(start)),count) + e0
+    # vertex halfedge: the last one that leaves the vertex
+    V = np.full(len(self.V),-1,dtype='int64')
+    np.maximum.at(V,v0,np.arange(3*nt) + h0)
+    for v in np.nonzero(V >= 0)[0].tolist():
+      self.V[v] = int(V[v])
+    self.H += H.tolist()
+    self.E += E.tolist()
+    self.T += (h[:,0] + h0).tolist()
 
   # add a triangle; it should result in a manifold mesh
   def addtriangle (self, v0, v1, v2):
@@ -301,11 +311,10 @@ class Mesh:
     w1 = self.H[p0][0]
     t0 = self.H[h0][2]
     t1 = self.H[h1][2]
-    l = self.distance(w0,w1)
-    d0 = self.orient(w0,w1,v0) / l / 2
-    d1 = self.orient(w0,w1,v1) / l / 2
-    tol = 1e-5
-    if (d0 > tol and d1 < -tol) or (d0 < -tol and d1 > tol):
+    # the quadrilateral must be strictly convex (robust orientation test)
+    d0 = self.orient(w0,w1,v0)
+    d1 = self.orient(w0,w1,v1)
+    if (d0 > 0 and d1 < 0) or (d0 < 0 and d1 > 0):
       self.H[h0] = [w0,e,t0,p0]
       self.H[h1] = [w1,e,t1,p1]
       self.H[n0] = [v1,self.H[n0][1],t1,h1]
@@ -324,18 +333,11 @@ class Mesh:
   
   # return if the triple vertices are counter clockwise oriented
   def ccw (self, v0, v1, v2):
-    a = self.C[v0]
-    b = self.C[v1]
-    c = self.C[v2]
-    m = np.array([[1,a[0],a[1]],[1,b[0],b[1]],[1,c[0],c[1]]])
-    return np.linalg.det(m) > 0
+    return utl.orient2d(self.C[v0],self.C[v1],self.C[v2]) > 0
 
+  # return the relative orientation of the triple vertices (twice the signed area)
   def orient (self, v0, v1, v2):
-    a = self.C[v0]
-    b = self.C[v1]
-    c = self.C[v2]
-    m = np.array([[1,a[0],a[1]],[1,b[0],b[1]],[1,c[0],c[1]]])
-    return np.linalg.det(m)
+    return utl.orient2d(self.C[v0],self.C[v1],self.C[v2])
 
   # check if vertex v is in the circle formed by v0v1v2
   def incircle (self, v0, v1, v2, v):
@@ -343,13 +345,7 @@ class Mesh:
     b = self.C[v1]
     c = self.C[v2]
     d = self.C[v]
-    m = np.array([
-                  [a[0],a[1],a[0]*a[0]+a[1]*a[1],1],
-                  [b[0],b[1],b[0]*b[0]+b[1]*b[1],1],
-                  [c[0],c[1],c[0]*c[0]+c[1]*c[1],1],
-                  [d[0],d[1],d[0]*d[0]+d[1]*d[1],1]
-                  ])
-    return np.linalg.det(m) > 0
+    return utl.incircle(a,b,c,d) > 0
 
   # check if the edge is legal
   def e_legal (self, e):
@@ -366,48 +362,70 @@ class Mesh:
     w0 = self.H[p1][0]
     w1 = self.H[p0][0]
     return (not self.incircle(v0,v1,w1,w0)) and (not self.incircle(v0,w0,v1,w1))
-  
+
+  # check if the edges are legal, evaluating the predicates at once
+  # return a boolean array, one entry for each edge in elist (a list; all edges by default)
+  def e_legal_batch (self, elist=None):
+    E = np.array(self.E,dtype='int64').reshape(-1,2)
+    if elist == None:
+      elist = np.arange(len(E))
+    elist = np.asarray(elist,dtype='int64')
+    legal = np.ones(len(elist),dtype=bool)
+    inner = np.nonzero(E[elist,1] != -1)[0]
+    if len(inner) == 0:
+      return legal
+    H = np.array(self.H,dtype='int64').reshape(-1,4)
+    C = np.array(self.C,dtype='float64').reshape(-1,3)
+    h0 = E[elist[inner],0]
+    h1 = E[elist[inner],1]
+    v0 = H[h0,0]
+    v1 = H[h1,0]
+    w0 = H[H[H[h1,3],3],0]
+    w1 = H[H[H[h0,3],3],0]
+    legal[inner] = ((utl.incircle_batch(C[v0],C[v1],C[w1],C[w0]) <= 0) &
+                    (utl.incircle_batch(C[v0],C[w0],C[v1],C[w1]) <= 0))
+    return legal
+
+  # convert the triangulation into Delaunay, flipping the queued illegal edges
+  # return the number of edge flips
   def delaunay (self):
-    done = False
-    while not done:
-      done = True
-      for e in range(0,len(self.E)):
-        if not self.e_legal(e):
-          self.swapedge(e)
-          done = False
+    n = 0
+    eset = {}
+    for e in np.nonzero(~self.e_legal_batch())[0].tolist():
+      eset[e] = True
+    while eset:
+      e,_ = eset.popitem()
+      if not self.e_legal(e) and self.swapedge(e):
+        n += 1
+        h0 = self.E[e][0]
+        h1 = self.E[e][1]
+        eset[self.H[self.next(h0)][1]] = True
+        eset[self.H[self.previous(h0)][1]] = True
+        eset[self.H[self.next(h1)][1]] = True
+        eset[self.H[self.previous(h1)][1]] = True
+    return n
 
   # return if the two vertex of the associated he edge forms a ccw triangle with given vertex
   def h_ccw (self, he, v):
     return self.ccw(self.H[he][0],v,self.H[self.next(he)][0])
 
-  # return a triangulation of points (X,Y) using the incremental algorithm
+  # return a Delaunay triangulation of points (X,Y)
+  # the triangles are computed at once (Qhull, O(n log n)), oriented ccw and sewed in bulk;
+  # the Delaunay condition is then ensured with the robust predicates (see delaunay)
+  # duplicated points remain isolated vertices
+  # return the number of flips needed to restore the Delaunay condition
   def triangulate (self, X, Y):
-    for (x,y) in zip(X,Y):
-      self.addvertex(x,y)
-    I = np.argsort(X)
-    if self.ccw(I[0],I[1],I[2]):
-      self.addtriangle(I[0],I[1],I[2]) 
-    else:
-      self.addtriangle(I[0],I[2],I[1])
-    bt = 0   # bottom border vertex
-    # for each remaining vertex to be included in triangulation
-    for i in I[3:len(X)]:  
-      hbt = self.border_h(bt)
-      if self.h_ccw(hbt,i): 
-        he = self.h_prevborder(hbt)
-        while self.h_ccw(he,i):     # try to move bt backward
-          hbt = he
-          he = self.h_prevborder(he)
-      else:
-        hbt = self.h_nextborder(hbt)
-        while not self.h_ccw(hbt,i): # try to move bt forward
-          hbt = self.h_nextborder(hbt)
-      bt = self.H[hbt][0] # update bottom vertex accordingly
-      self.addtriangle(self.H[hbt][0],i,self.H[self.next(hbt)][0])  # add first triangle
-      he = self.h_nextborder(hbt)
-      while self.h_ccw(he,i):     # add remaining triangle fan
-        self.addtriangle(self.H[he][0],i,self.H[self.next(he)][0])  # add first triangle
-        he = self.h_nextborder(he)
+    P = np.stack((np.asarray(X,dtype='float64'),np.asarray(Y,dtype='float64')),axis=1)
+    v0 = len(self.V)
+    self.C += np.hstack((P,np.zeros((len(P),1)))).tolist()
+    self.V += [-1] * len(P)
+    I = scipy.spatial.Delaunay(P).simplices.astype('int64')
+    o = utl.orient2d_batch(P[I[:,0]],P[I[:,1]],P[I[:,2]])
+    I = I[o != 0]
+    o = o[o != 0]
+    I[o < 0] = I[o < 0][:,[0,2,1]]
+    self.sew(I + v0)
+    return self.delaunay()
 
   # compute distance between two vertices
   def distance (self, v0, v1):
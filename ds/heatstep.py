@@ -0,0 +1,64 @@
+# heatstep: time-stepped heat diffusion for intrinsic triangulations
+# Waldemar Celes
+# Tecgraf Institute of PUC-Rio
+# celes@tecgraf.puc-rio.br
+
+# This is an auxiliary class that evolves heat diffusion over time with a fixed time step:
+#   (M - theta dt K) u(n+1) = (M + (1-theta) dt K) u(n)
+# with theta = 1 (backward Euler) or theta = 1/2 (Crank-Nicolson).
+# The system is factorized once; each step costs one back-substitution.
+# The transfer of the intrinsic field to the extrinsic vertices (see data_transfer) is also
+# built and factorized once, so each frame is a pair of arrays ready to feed PROP/PROP_E.
+
+import numpy as np
+import scipy
+
+class HeatStepper:
+  def __init__ (self, mesh, Ti, dt, crank_nicolson=False, fixed=False, transfer=True):
+    self.mesh = mesh
+    self.dt = dt
+    self.theta = 0.5 if crank_nicolson else 1.0
+    self.fixed = fixed  # keep the temperatures of the sources (Dirichlet conditions)
+    n = len(mesh.V)
+    K = mesh.StiffnessMatrix()
+    M = mesh.MassMatrix()
+    A = (M - self.theta * dt * K).tolil()
+    self.B = (M + (1 - self.theta) * dt * K).tocsr()
+    self.u = np.zeros(n)
+    for i, T in Ti.items():
+      self.u[i] = T
+    self.src = np.array(list(Ti.keys()),dtype='int64')
+    self.c = np.zeros(n)
+    if fixed:
+      # eliminate the source vertices, as in HeatDiffusion
+      self.c = A[:,self.src].tocsr() @ self.u[self.src]
+      for i in self.src:
+        A[:,i] = 0
+        A[i,:] = 0
+        A[i,i] = 1
+    self.solver = scipy.sparse.linalg.splu(A.tocsc())
+    self.transfer = None
+    if transfer:
+      mat, self.P = mesh.transfer_system()
+      self.mat = mat
+      self.transfer = scipy.sparse.linalg.splu((mat.T @ mat).tocsc())  # normal equations
+
+  # advance one time step, returning the intrinsic field
+  def step (self):
+    b = self.B @ self.u - self.c
+    if self.fixed:
+      b[self.src] = self.u[self.src]
+    self.u = self.solver.solve(b)
+    return self.u
+
+  # map an intrinsic field to the extrinsic vertices (least square transfer)
+  def extrinsic (self, u):
+    return self.transfer.solve(self.mat.T @ (self.P @ u))
+
+  # generate nsteps frames: (intrinsic field, extrinsic field)
+  # the extrinsic field is None if the transfer was not requested
+  def frames (self, nsteps):
+    for k in range(nsteps):
+      u = self.step()
+      ue = self.extrinsic(u) if self.transfer else None
+      yield u.copy(), ue
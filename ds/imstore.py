@@ -0,0 +1,95 @@
+# imstore: memory-mappable storage of intrinsic triangulations
+# Waldemar Celes
+# Tecgraf Institute of PUC-Rio
+# celes@tecgraf.puc-rio.br
+
+# This is an auxiliary module that saves an intrinsic triangulation (she or she3) and its
+# extrinsic mesh to a single versioned file, and loads it back.
+# File layout: magic (8 bytes), version and header size (two uint32), a JSON header with the
+# kind of mesh, an optional source reference and the table of arrays (dtype, shape and offset),
+# followed by the raw arrays, each aligned to a page boundary.
+# As the arrays are stored in native order, they can be mapped (numpy.memmap) without copying:
+# the mapped mesh is read only and its pages are shared by all processes that open the file.
+
+import os
+import json
+import struct
+import numpy as np
+from . import he
+
+MAGIC = b'SHEMESH\0'
+VERSION = 1
+ALIGN = 4096
+
+# save an intrinsic triangulation (and its extrinsic mesh) to a file
+# source is an optional reference to the original mesh (e.g. its filename)
+def save (mesh, filename, source=None):
+  HE = mesh.HE
+  arrays = mesh.state()
+  arrays['narrow'] = arrays['narrow'].astype('u1')
+  lmin = arrays.pop('lmin')
+  arrays['HE.C'] = np.array(HE.C,dtype='float64').reshape(-1,3)
+  arrays['HE.V'] = np.array(HE.V,dtype='int64')
+  arrays['HE.E'] = np.array(HE.E,dtype='int64').reshape(-1,2)
+  arrays['HE.T'] = np.array(HE.T,dtype='int64')
+  arrays['HE.H'] = np.array(HE.H,dtype='int64').reshape(-1,4)
+  table = {}
+  offset = 0
+  for name, a in arrays.items():
+    table[name] = {'dtype': a.dtype.str, 'shape': list(a.shape), 'offset': offset}
+    offset += -(-a.nbytes // ALIGN) * ALIGN
+  header = json.dumps({
+    'kind': type(mesh).__module__.split('.')[-1],
+    'source': source,
+    'lmin': lmin,
+    'arrays': table,
+  }).encode()
+  start = -(-(len(MAGIC) + 8 + len(header)) // ALIGN) * ALIGN
+  tmp = filename + '.tmp'
+  with open(tmp,'wb') as f:
+    f.write(MAGIC + struct.pack('<II',VERSION,len(header)) + header)
+    for name, a in arrays.items():
+      f.seek(start + table[name]['offset'])
+      f.write(np.ascontiguousarray(a).tobytes())
+    f.truncate(start + offset)
+  os.replace(tmp,filename)
+
+# read the header of a file; return the header (dictionary) and the start of the arrays
+def header (filename):
+  with open(filename,'rb') as f:
+    if f.read(len(MAGIC)) != MAGIC:
+      raise ValueError("not an intrinsic mesh file")
+    version, size = struct.unpack('<II',f.read(8))
+    if version > VERSION:
+      raise ValueError("unsupported intrinsic mesh file version: %d" % version)
+    h = json.loads(f.read(size))
+  h['version'] = version
+  return h, -(-(len(MAGIC) + 8 + size) // ALIGN) * ALIGN
+
+# load an intrinsic triangulation saved by save
+# cls is the intrinsic mesh class (she.IntrinsicMesh or she3.IntrinsicMesh)
+# if mmap is set, the arrays are mapped read only, without copying; otherwise they are
+# converted to lists and the mesh can be modified
+def load (filename, cls, mmap=True):
+  h, start = header(filename)
+  kind = cls.__module__.split('.')[-1]
+  if h['kind'] != kind:
+    raise ValueError("file stores a %s mesh, not %s" % (h['kind'],kind))
+  arrays = {}
+  for name, d in h['arrays'].items():
+    shape = tuple(d['shape'])
+    if np.prod(shape) == 0:
+      a = np.zeros(shape,dtype=d['dtype'])
+    else:
+      a = np.memmap(filename,dtype=d['dtype'],mode='r',offset=start+d['offset'],shape=shape)
+    if d['dtype'] == '|u1':
+      a = a.view(bool)
+    arrays[name] = a if mmap else a.tolist()
+  HE = he.Mesh()
+  HE.C = arrays.pop('HE.C')
+  HE.V = arrays.pop('HE.V')
+  HE.E = arrays.pop('HE.E')
+  HE.T = arrays.pop('HE.T')
+  HE.H = arrays.pop('HE.H')
+  arrays['lmin'] = h['lmin']
+  return cls(HE,None,arrays)
@@ -0,0 +1,87 @@
+# lmatrix: live sparse matrix for intrinsic triangulations
+# Waldemar Celes
+# Tecgraf Institute of PUC-Rio
+# celes@tecgraf.puc-rio.br
+
+# This is an auxiliary class that keeps a sparse matrix, assembled per vertex row,
+# up to date with the operations applied to the mesh.
+# The mesh notifies the vertices whose triangles were modified (swapedge, t_refine,
+# e_refine, vertex_displacement); only the corresponding rows are recomputed,
+# and only when the matrix is requested.
+
+import numpy as np
+import scipy
+
+class LMatrix:
+  def __init__ (self, mesh, rowfunc, dtype='float64', ring=False, build=None):
+    self.mesh = mesh
+    self.rowfunc = rowfunc  # return the row of a vertex: [j,...], [value,...] (repeated j are summed)
+    self.build = build      # optional function that assembles the whole matrix at once
+    self.dtype = dtype
+    self.ring = ring        # rows also depend on the neighbor vertices (e.g. tangent frames)
+    self.pending = set()    # vertices modified since the last update
+    self.full = False       # request full assembly (e.g. after renumbering entities)
+    self.dirty = set()      # rows modified since the last call to clean
+    self.version = 0        # incremented each time the matrix changes
+    self.K = self.build() if self.build else self.assemble(range(len(mesh.V)))
+    mesh.observers.append(self)
+
+  # register modified vertices
+  def touch (self, vlist):
+    self.pending.update(vlist)
+
+  # request the assembly of all rows
+  def reset (self):
+    self.full = True
+
+  # acknowledge the modified rows (e.g. after a factorization is updated)
+  def clean (self):
+    self.dirty.clear()
+
+  # return the up to date matrix in csr format
+  def matrix (self):
+    self.update()
+    return self.K
+
+  # assemble the given rows in a n x n csr matrix
+  def assemble (self, rows):
+    n = len(self.mesh.V)
+    I = []
+    J = []
+    X = []
+    for i in rows:
+      cols, vals = self.rowfunc(i)
+      I += [i] * len(cols)
+      J += cols
+      X += vals
+    return scipy.sparse.csr_matrix((np.array(X,dtype=self.dtype),(I,J)),shape=(n,n))
+
+  # recompute the rows affected by the pending modifications
+  def update (self):
+    n = len(self.mesh.V)
+    if self.full:
+      self.K = self.build() if self.build else self.assemble(range(n))
+      self.dirty.update(range(n))
+      self.pending.clear()
+      self.full = False
+      self.version += 1
+      return
+    if not self.pending:
+      return
+    rows = set(self.pending)
+    if self.ring:
+      mesh = self.mesh
+      for v in self.pending:
+        for h in mesh.adj_vh(v):
+          rows.add(mesh.H[mesh.next(h)][0])
+          rows.add(mesh.H[mesh.previous(h)][0])
+    rows = sorted(rows)
+    if self.K.shape[0] != n:
+      self.K.resize((n,n))
+    mask = np.ones(n)
+    mask[rows] = 0
+    self.K = (scipy.sparse.diags(mask) @ self.K + self.assemble(rows)).tocsr()
+    self.K.eliminate_zeros()
+    self.dirty.update(rows)
+    self.pending.clear()
+    self.version += 1
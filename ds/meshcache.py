@@ -0,0 +1,93 @@
+# meshcache: on-disk cache of preprocessed meshes
+# Waldemar Celes
+# Tecgraf Institute of PUC-Rio
+# celes@tecgraf.puc-rio.br
+
+# This is an auxiliary class that stores, in a cache directory, the preprocessed arrays of a
+# mesh file: the halfedge connectivity built by sew (he.Mesh) and the initial intrinsic
+# state (edge lengths after mollification, narrow vertex flags and minimum edge length).
+# Entries are uncompressed npz files keyed by a hash of the file content and of the
+# construction parameters, so later loads skip the sewing, the length computation, the
+# mollification and the consistency check.
+
+import os
+import hashlib
+import zipfile
+import numpy as np
+from . import he
+from . import meshio
+
+VERSION = 1  # format version of the cache entries (part of the key)
+
+class MeshCache:
+  def __init__ (self, directory):
+    self.directory = directory
+    os.makedirs(directory,exist_ok=True)
+    self.hits = 0
+    self.misses = 0
+
+  # compute the key of a mesh file: hash of its content and of the construction parameters
+  def key (self, filename, mollification_factor=None):
+    h = hashlib.sha256()
+    with open(filename,'rb') as f:
+      while True:
+        block = f.read(1 << 24)
+        if not block:
+          break
+        h.update(block)
+    h.update(repr((VERSION,os.path.splitext(filename)[1].lower(),mollification_factor)).encode())
+    return h.hexdigest()
+
+  # return the path of the cache entry of a key
+  def path (self, key):
+    return os.path.join(self.directory,key + '.npz')
+
+  # load a mesh file, from the cache if possible
+  # cls is the intrinsic mesh class (she.IntrinsicMesh or she3.IntrinsicMesh)
+  # return the extrinsic and the intrinsic meshes
+  def load (self, filename, cls, mollification_factor=None):
+    path = self.path(self.key(filename,mollification_factor))
+    if os.path.exists(path):
+      try:
+        HE, state = self.read(path)
+        self.hits += 1
+        return HE, cls(HE,mollification_factor,state)
+      except (OSError, KeyError, ValueError, zipfile.BadZipFile):
+        pass  # damaged entry: rebuild it
+    self.misses += 1
+    HE = meshio.load_mesh(filename)
+    mesh = cls(HE,mollification_factor)
+    self.write(path,HE,mesh.state(False))
+    return HE, mesh
+
+  # write a cache entry
+  # the entry is written to a temporary file first, so concurrent readers never see a partial file
+  def write (self, path, HE, state):
+    data = {
+      'C': np.array(HE.C,dtype='float64').reshape(-1,3),
+      'V': np.array(HE.V,dtype='int64'),
+      'E': np.array(HE.E,dtype='int64').reshape(-1,2),
+      'T': np.array(HE.T,dtype='int64'),
+      'H': np.array(HE.H,dtype='int64').reshape(-1,4),
+      'L': state['L'],
+      'narrow': state['narrow'],
+      'lmin': np.array(state['lmin']),
+    }
+    tmp = path + '.%d.tmp' % os.getpid()
+    with open(tmp,'wb') as f:
+      np.savez(f,**data)
+    os.replace(tmp,path)
+
+  # read a cache entry; return the extrinsic mesh and the intrinsic state
+  def read (self, path):
+    with np.load(path) as data:
+      HE = he.Mesh()
+      HE.C = data['C'].tolist()
+      HE.V = data['V'].tolist()
+      HE.E = data['E'].tolist()
+      HE.T = data['T'].tolist()
+      HE.H = data['H'].tolist()
+      state = {'L': data['L'].tolist(), 'narrow': data['narrow'].tolist(), 'lmin': float(data['lmin'])}
+    if len(state['L']) != len(HE.E) or len(state['narrow']) != len(HE.V):
+      raise ValueError("inconsistent cache entry")
+    return HE, state
@@ -0,0 +1,380 @@
+# meshio: triangle mesh loaders and writers (PLY and OBJ)
+# Waldemar Celes
+# Tecgraf Institute of PUC-Rio
+# celes@tecgraf.puc-rio.br
+
+# This is an auxiliary module that reads triangle meshes into arrays, ready to be sewed
+# in bulk by he.Mesh: vertex coordinates (n x 3, float64) and triangle incidence (m x 3, int64).
+# Binary PLY files are memory mapped (numpy.memmap) and read in chunks, so their elements
+# can also be streamed (see iter_ply); ASCII PLY and OBJ files are tokenized in blocks of lines.
+# Polygonal faces are split into triangle fans.
+# Meshes are written as binary PLY (or OBJ) files in chunks; the common subdivision of an
+# intrinsic mesh is streamed one extrinsic triangle at a time, so the memory is bounded by
+# the chunk size regardless of the size of the output.
+
+import os
+import shutil
+import numpy as np
+from . import he
+
+CHUNK = 1 << 20  # number of elements (binary) or lines (text) processed at once
+
+PLY_TYPES = {
+  'char': 'i1', 'int8': 'i1', 'uchar': 'u1', 'uint8': 'u1',
+  'short': 'i2', 'int16': 'i2', 'ushort': 'u2', 'uint16': 'u2',
+  'int': 'i4', 'int32': 'i4', 'uint': 'u4', 'uint32': 'u4',
+  'float': 'f4', 'float32': 'f4', 'double': 'f8', 'float64': 'f8',
+}
+
+# read a mesh file (.ply or .obj); return vertex coordinates and triangles
+def read_mesh (filename):
+  if filename.lower().endswith('.obj'):
+    return read_obj(filename)
+  return read_ply(filename)
+
+# read a mesh file into a halfedge data structure
+def load_mesh (filename):
+  V, F = read_mesh(filename)
+  return he.Mesh(V,F)
+
+# split polygons (list of index lists) into triangle fans
+def fan (polygons):
+  I = []
+  for p in polygons:
+    for i in range(1,len(p)-1):
+      I.append([p[0],p[i],p[i+1]])
+  return np.array(I,dtype='int64').reshape(-1,3)
+
+# parse the header of a PLY file
+# return the format, the header size in bytes and the elements:
+#  [(name, count, [(property, type)] or [(property, count type, index type)] for lists)]
+def ply_header (f):
+  line = f.readline()
+  if line.strip() != b'ply':
+    raise ValueError("not a PLY file")
+  fmt = None
+  elements = []
+  while True:
+    line = f.readline()
+    if not line:
+      raise ValueError("PLY header without end_header")
+    tokens = line.split()
+    if not tokens or tokens[0] in (b'comment',b'obj_info'):
+      continue
+    key = tokens[0].decode()
+    if key == 'format':
+      fmt = tokens[1].decode()
+    elif key == 'element':
+      elements.append((tokens[1].decode(),int(tokens[2]),[]))
+    elif key == 'property':
+      if tokens[1] == b'list':
+        elements[-1][2].append((tokens[4].decode(),PLY_TYPES[tokens[2].decode()],PLY_TYPES[tokens[3].decode()]))
+      else:
+        elements[-1][2].append((tokens[2].decode(),PLY_TYPES[tokens[1].decode()]))
+    elif key == 'end_header':
+      return fmt, f.tell(), elements
+
+# stream the elements of a binary PLY file
+# generate (element name, structured array chunk) pairs; faces must be triangles
+# (as 'vertex_indices' or 'vertex_index' lists with a fixed count of 3)
+def iter_ply (filename, chunk=CHUNK):
+  with open(filename,'rb') as f:
+    fmt, offset, elements = ply_header(f)
+  if fmt == 'ascii':
+    raise ValueError("iter_ply requires a binary PLY file")
+  order = '<' if fmt == 'binary_little_endian' else '>'
+  for name, count, props in elements:
+    fields = []
+    for p in props:
+      if len(p) == 3:
+        fields.append((p[0]+'_count',order+p[1]))
+        fields.append((p[0],order+p[2],(3,)))
+      else:
+        fields.append((p[0],order+p[1]))
+    dtype = np.dtype(fields)
+    if count > 0:
+      data = np.memmap(filename,dtype=dtype,mode='r',offset=offset,shape=(count,))
+      for i in range(0,count,chunk):
+        block = data[i:i+chunk]
+        for p in props:
+          if len(p) == 3 and np.any(block[p[0]+'_count'] != 3):
+            raise ValueError("non triangular faces cannot be streamed")
+        yield name, block
+      del data
+    offset += count * dtype.itemsize
+
+# read a PLY file (binary or ASCII); return vertex coordinates and triangles
+def read_ply (filename):
+  with open(filename,'rb') as f:
+    fmt, offset, elements = ply_header(f)
+    if fmt == 'ascii':
+      return read_ply_ascii(f,elements)
+  V = []
+  F = []
+  try:
+    for name, block in iter_ply(filename):
+      if name == 'vertex':
+        V.append(np.stack((block['x'],block['y'],block['z']),axis=1).astype('float64'))
+      elif name == 'face':
+        F.append(face_indices(block).astype('int64'))
+  except ValueError:
+    # polygonal faces: parse the variable-length records
+    return read_ply_polygons(filename,fmt,offset,elements)
+  return (np.concatenate(V) if V else np.zeros((0,3)),
+          np.concatenate(F) if F else np.zeros((0,3),dtype='int64'))
+
+# return the index field of a face block
+def face_indices (block):
+  for name in ('vertex_indices','vertex_index'):
+    if name in block.dtype.names:
+      return block[name]
+  raise ValueError("PLY face element without vertex indices")
+
+# read a binary PLY file with polygonal faces
+def read_ply_polygons (filename, fmt, offset, elements):
+  order = '<' if fmt == 'binary_little_endian' else '>'
+  data = np.memmap(filename,dtype='u1',mode='r',offset=offset)
+  pos = 0
+  V = np.zeros((0,3))
+  F = np.zeros((0,3),dtype='int64')
+  for name, count, props in elements:
+    if all(len(p) == 2 for p in props):
+      dtype = np.dtype([(p[0],order+p[1]) for p in props])
+      block = np.frombuffer(data,dtype=dtype,count=count,offset=pos)
+      pos += count * dtype.itemsize
+      if name == 'vertex':
+        V = np.stack((block['x'],block['y'],block['z']),axis=1).astype('float64')
+      continue
+    polygons = []
+    for i in range(count):
+      for p in props:
+        if len(p) == 2:
+          pos += np.dtype(p[1]).itemsize
+          continue
+        n = int(np.frombuffer(data,dtype=order+p[1],count=1,offset=pos)[0])
+        pos += np.dtype(p[1]).itemsize
+        idx = np.frombuffer(data,dtype=order+p[2],count=n,offset=pos)
+        pos += n * np.dtype(p[2]).itemsize
+        if name == 'face' and p[0] in ('vertex_indices','vertex_index'):
+          polygons.append(idx.tolist())
+    if name == 'face':
+      F = fan(polygons)
+  return V, F
+
+# read the body of an ASCII PLY file (after the header), in blocks of lines
+def read_ply_ascii (f, elements, chunk=CHUNK):
+  V = [np.zeros((0,3))]
+  F = [np.zeros((0,3),dtype='int64')]
+  for name, count, props in elements:
+    names = [p[0] for p in props]
+    for i in range(0,count,chunk):
+      rows = [f.readline() for k in range(min(chunk,count-i))]
+      if all(len(p) == 2 for p in props):
+        if name == 'vertex':
+          block = tokens(rows,len(props))
+          V.append(block[:,[names.index('x'),names.index('y'),names.index('z')]])
+        continue
+      if name != 'face':
+        continue
+      if len(props) == 1:
+        # fast path: all faces are triangles
+        try:
+          block = tokens(rows,4)
+          if np.all(block[:,0] == 3):
+            F.append(block[:,1:4].astype('int64'))
+            continue
+        except ValueError:
+          pass
+      polygons = []
+      for row in rows:
+        values = row.split()
+        k = 0
+        for p in props:
+          if len(p) == 2:
+            k += 1
+            continue
+          n = int(values[k])
+          if p[0] in ('vertex_indices','vertex_index'):
+            polygons.append([int(x) for x in values[k+1:k+1+n]])
+          k += 1 + n
+      F.append(fan(polygons))
+  return np.concatenate(V), np.concatenate(F)
+
+# tokenize a block of text lines with ncol numbers each
+def tokens (rows, ncol):
+  block = np.array(b' '.join(rows).split(),dtype='float64')
+  if len(block) != len(rows) * ncol:
+    raise ValueError("unexpected number of values")
+  return block.reshape(-1,ncol)
+
+# read an OBJ file (vertices and faces only); return vertex coordinates and triangles
+# negative (relative) indices and v/vt/vn references are supported
+def read_obj (filename, chunk=CHUNK):
+  V = [np.zeros((0,3))]
+  F = [np.zeros((0,3),dtype='int64')]
+  nv = 0
+  with open(filename,'rb') as f:
+    while True:
+      lines = f.readlines(chunk * 32)
+      if not lines:
+        break
+      vrows = []
+      frows = []
+      fbase = []  # number of vertices before each face (for relative indices)
+      for l in lines:
+        if l.startswith(b'v '):
+          vrows.append(l[2:])
+        elif l.startswith(b'f '):
+          frows.append(l[2:].split())
+          fbase.append(nv + len(vrows))
+      if vrows:
+        try:
+          block = tokens(vrows,3)
+        except ValueError:
+          block = np.array([r.split()[0:3] for r in vrows],dtype='float64')
+        V.append(block)
+      if frows:
+        if all(len(r) == 3 for r in frows):
+          idx = np.array([t.split(b'/')[0] for r in frows for t in r],dtype='int64').reshape(-1,3)
+          base = np.array(fbase,dtype='int64')[:,None]
+        else:
+          idx = []
+          base = []
+          for r, b in zip(frows,fbase):
+            p = fan([[int(t.split(b'/')[0]) for t in r]])
+            idx.append(p)
+            base += [b] * len(p)
+          idx = np.concatenate(idx)
+          base = np.array(base,dtype='int64')[:,None]
+        # one based indices; negative indices are relative to the vertices read so far
+        F.append(np.where(idx < 0,idx + base,idx - 1))
+      nv += len(vrows)
+  return np.concatenate(V), np.concatenate(F)
+
+# write a triangle mesh to a binary PLY file (or to an OBJ file, by extension)
+# fprops is an optional dictionary of integer face properties, {name: array} (PLY only)
+def write_mesh (filename, V, F, fprops=None, chunk=CHUNK):
+  V = np.asarray(V,dtype='float64').reshape(-1,3)
+  F = np.asarray(F,dtype='int64').reshape(-1,3)
+  fprops = fprops or {}
+  if filename.lower().endswith('.obj'):
+    with open(filename,'wb') as f:
+      for i in range(0,len(V),chunk):
+        write_obj_vertices(f,V[i:i+chunk])
+      for i in range(0,len(F),chunk):
+        write_obj_faces(f,F[i:i+chunk])
+    return
+  with open(filename,'wb') as f:
+    write_ply_header(f,len(V),len(F),list(fprops))
+    for i in range(0,len(V),chunk):
+      f.write(ply_vertices(V[i:i+chunk]).tobytes())
+    for i in range(0,len(F),chunk):
+      props = {name: np.asarray(p)[i:i+chunk] for name, p in fprops.items()}
+      f.write(ply_faces(F[i:i+chunk],props).tobytes())
+
+# write the header of a binary PLY file with float vertices and triangles
+def write_ply_header (f, nv, nf, fprops=[]):
+  header = ['ply','format binary_little_endian 1.0',
+            'element vertex %d' % nv,'property float x','property float y','property float z',
+            'element face %d' % nf,'property list uchar int vertex_indices']
+  header += ['property int %s' % name for name in fprops]
+  header += ['end_header','']
+  f.write('\n'.join(header).encode())
+
+# return the PLY records of a block of vertices
+def ply_vertices (V):
+  data = np.empty(len(V),dtype=[('x','<f4'),('y','<f4'),('z','<f4')])
+  data['x'] = V[:,0]
+  data['y'] = V[:,1]
+  data['z'] = V[:,2]
+  return data
+
+# return the PLY records of a block of triangles with integer properties
+def ply_faces (F, fprops):
+  data = np.empty(len(F),dtype=[('n','u1'),('vertex_indices','<i4',(3,))] +
+                               [(name,'<i4') for name in fprops])
+  data['n'] = 3
+  data['vertex_indices'] = F
+  for name, p in fprops.items():
+    data[name] = p
+  return data
+
+# write a block of vertices to an OBJ file
+def write_obj_vertices (f, V):
+  np.savetxt(f,V,fmt='v %.17g %.17g %.17g')
+
+# write a block of triangles (zero based) to an OBJ file
+def write_obj_faces (f, F):
+  np.savetxt(f,F+1,fmt='f %d %d %d')
+
+# write an intrinsic mesh, with the inserted vertices at their 3d extrinsic positions
+def write_intrinsic (mesh, filename, chunk=CHUNK):
+  V = mesh.v_positions()
+  F = np.array([mesh.t_get_inc(t) for t in range(len(mesh.T))],dtype='int64').reshape(-1,3)
+  write_mesh(filename,V,F,None,chunk)
+
+# generate the common subdivision of an intrinsic mesh in blocks of (about) chunk triangles
+# yield extrinsic ids, intrinsic ids and triangle coordinates (k x 3 x 3) of each block
+def iter_common_subdivision (mesh, chunk=CHUNK):
+  mark = [-1 for i in range(0,len(mesh.T))]
+  elist = []
+  ilist = []
+  clist = []
+  for te in range(0,len(mesh.HE.T)):
+    il, cl = mesh.te_common_subdivision(te,mark)
+    elist += [te] * len(il)
+    ilist += il
+    clist += cl
+    if len(elist) >= chunk or te == len(mesh.HE.T)-1:
+      yield (np.array(elist,dtype='int64'),np.array(ilist,dtype='int64'),
+             np.array(clist,dtype='float64').reshape(-1,3,3))
+      elist = []
+      ilist = []
+      clist = []
+
+# stream the common subdivision of an intrinsic mesh to a binary PLY file (or an OBJ file)
+# each triangle has its own three vertices; PLY faces store the extrinsic and the intrinsic ids
+# (properties 'extrinsic' and 'intrinsic'); return the number of triangles
+def write_common_subdivision (mesh, filename, chunk=CHUNK):
+  n = 0
+  if filename.lower().endswith('.obj'):
+    with open(filename,'wb') as f:
+      for elist, ilist, C in iter_common_subdivision(mesh,chunk):
+        write_obj_vertices(f,C.reshape(-1,3))
+        write_obj_faces(f,np.arange(3*n,3*(n+len(C))).reshape(-1,3))
+        n += len(C)
+    return n
+  # the number of elements is only known at the end: vertices and ids go to temporary files
+  vtmp = filename + '.v.tmp'
+  itmp = filename + '.i.tmp'
+  try:
+    with open(vtmp,'wb') as fv, open(itmp,'wb') as fi:
+      for elist, ilist, C in iter_common_subdivision(mesh,chunk):
+        fv.write(ply_vertices(C.reshape(-1,3)).tobytes())
+        fi.write(np.stack((elist,ilist),axis=1).astype('<i4').tobytes())
+        n += len(C)
+    with open(filename,'wb') as f:
+      write_ply_header(f,3*n,n,['extrinsic','intrinsic'])
+      with open(vtmp,'rb') as fv:
+        shutil.copyfileobj(fv,f)
+      with open(itmp,'rb') as fi:
+        for i in range(0,n,chunk):
+          ids = np.fromfile(fi,dtype='<i4',count=2*min(chunk,n-i)).reshape(-1,2)
+          F = np.arange(3*i,3*(i+len(ids))).reshape(-1,3)
+          f.write(ply_faces(F,{'extrinsic': ids[:,0],'intrinsic': ids[:,1]}).tobytes())
+  finally:
+    for tmp in (vtmp,itmp):
+      if os.path.exists(tmp):
+        os.remove(tmp)
+  return n
+
+# write polylines, given in flat arrays (offsets and points, see e_polylines), to an OBJ file
+def write_polylines (filename, offsets, points, chunk=CHUNK):
+  offsets = np.asarray(offsets,dtype='int64')
+  points = np.asarray(points,dtype='float64').reshape(-1,3)
+  with open(filename,'wb') as f:
+    for i in range(0,len(points),chunk):
+      write_obj_vertices(f,points[i:i+chunk])
+    for i in range(len(offsets)-1):
+      if offsets[i+1] - offsets[i] >= 2:
+        f.write(b'l ' + b' '.join(b'%d' % j for j in range(offsets[i]+1,offsets[i+1]+1)) + b'\n')
@@ -0,0 +1,131 @@
+# refine: resumable Delaunay refinement for intrinsic triangulations
+# Waldemar Celes
+# Tecgraf Institute of PUC-Rio
+# celes@tecgraf.puc-rio.br
+
+# This is an auxiliary class that drives Chew's refinement (as chew93) with limits:
+# a maximum number of vertices, a wall-clock budget and a schedule of target minimum angles
+# (each stage refines the mesh up to its angle before moving to the next one).
+# The refinement state (intrinsic arrays, triangle heap and schedule position) can be saved
+# to disk periodically and resumed later, over an intrinsic mesh created from the same
+# extrinsic mesh.
+
+import os
+import time
+import numpy as np
+from .theap import THeap
+
+class Refinement:
+  def __init__ (self, mesh, schedule, policy='circumcenter', amax=None, size=None, tsize=None,
+                max_vertices=None, time_limit=None):
+    self.mesh = mesh
+    if isinstance(schedule,(int,float)):
+      schedule = [schedule]
+    self.schedule = list(schedule)  # target minimum angles
+    self.policy = policy
+    self.amax = amax
+    self.size = size
+    self.tsize = tsize
+    self.max_vertices = max_vertices
+    self.time_limit = time_limit    # in seconds, for each call to run
+    self.stage = 0                  # current position in the schedule
+    self.hp = None                  # triangle heap of the current stage
+    self.inserted = 0               # total number of inserted vertices
+
+  # run the refinement until it is done or a limit is reached
+  # if a checkpoint file is given, the state is saved every interval seconds and at the end
+  # return the status: 'done', 'max_vertices' or 'time_limit'
+  def run (self, checkpoint=None, interval=60):
+    mesh = self.mesh
+    t0 = time.time()
+    tsave = t0
+    status = 'done'
+    lazy = mesh.set_lazy(True)
+    try:
+      while self.stage < len(self.schedule):
+        amin = self.schedule[self.stage]
+        if self.hp == None:
+          self.hp = THeap(mesh,amin,self.amax,self.size,self.tsize)
+        while True:
+          if self.max_vertices != None and len(mesh.V) >= self.max_vertices:
+            status = 'max_vertices'
+            break
+          now = time.time()
+          if self.time_limit != None and now - t0 >= self.time_limit:
+            status = 'time_limit'
+            break
+          if checkpoint and now - tsave >= interval:
+            self.save(checkpoint)
+            tsave = now
+          t, area, angle = self.hp.pop()
+          if t == None:
+            break
+          v, tset = mesh.t_add_vertex(t,self.policy,amin)
+          if not v:
+            continue  # Steiner point at an existing vertex: t is dropped
+          self.inserted += 1
+          mesh.t_requeue(t,self.policy,tset)
+          self.hp.update(tset)
+        if status != 'done':
+          break
+        self.stage += 1
+        self.hp = None
+    finally:
+      mesh.set_lazy(lazy)
+    if checkpoint:
+      self.save(checkpoint)
+    return status
+
+  # save the refinement state to a file (numpy npz format)
+  # the file is written to a temporary file first, so a killed job keeps the previous checkpoint
+  def save (self, filename):
+    mesh = self.mesh
+    mesh.repair_support()
+    data = {
+      'V': np.array(mesh.V,dtype='int64'),
+      'E': np.array(mesh.E,dtype='int64').reshape(-1,2),
+      'T': np.array(mesh.T,dtype='int64'),
+      'H': np.array(mesh.H,dtype='int64').reshape(-1,4),
+      'L': np.array(mesh.L,dtype='float64'),
+      'S': np.array(mesh.S,dtype='int64'),
+      'A': np.array(mesh.A,dtype='float64'),
+      'schedule': np.array(self.schedule,dtype='float64'),
+      'stage': np.array(self.stage),
+      'inserted': np.array(self.inserted),
+      'policy': np.array(self.policy),
+    }
+    if self.hp != None:
+      heap, ts, size = self.hp.state()
+      data['heap'] = heap
+      data['ts'] = ts
+      if self.hp.size != None:
+        data['size'] = size
+    tmp = filename + '.tmp'
+    with open(tmp,'wb') as f:
+      np.savez(f,**data)
+    os.replace(tmp,filename)
+
+  # restore a refinement state saved by save
+  # the mesh must be created from the same extrinsic mesh (its arrays are replaced)
+  # the limits and criteria are given as in the constructor; schedule and policy are restored
+  @staticmethod
+  def load (mesh, filename, amax=None, size=None, tsize=None, max_vertices=None, time_limit=None):
+    with np.load(filename) as data:
+      if len(data['S']) != len(mesh.S):
+        raise ValueError("checkpoint does not match the extrinsic mesh")
+      mesh.V = data['V'].tolist()
+      mesh.E = data['E'].tolist()
+      mesh.T = data['T'].tolist()
+      mesh.H = data['H'].tolist()
+      mesh.L = data['L'].tolist()
+      mesh.S = data['S'].tolist()
+      mesh.A = data['A'].tolist()
+      mesh.renumbered()
+      r = Refinement(mesh,data['schedule'].tolist(),str(data['policy']),amax,size,tsize,
+                     max_vertices,time_limit)
+      r.stage = int(data['stage'])
+      r.inserted = int(data['inserted'])
+      if 'heap' in data:
+        r.hp = THeap(mesh,r.schedule[r.stage],amax,None,None,
+                     (data['heap'],data['ts'],data['size'].tolist() if 'size' in data else None))
+    return r
@@ -7,51 +7,109 @@
 # An edge on the border has its second halfedge set to -1
 # This version stores 3 supporting halfedge information per extrinsic triangle
 
-import copy
 import numpy as np
 import scipy
 import math
 from . import utl
 from .theap import THeap
+from .lmatrix import LMatrix
+from .spectrum import Spectrum
+from .heatstep import HeatStepper
+from .smooth import Smoother
+from .refine import Refinement
+from .embed import Embedding
+from .etrace import EdgeTracer
+from .walker import Walker
+from .vheat import VectorHeat
 
 L_MIN = 1e-10
+STEINER_TOL = 1e-9   # Steiner points closer to a vertex (baricentric coordinate) are not inserted
+MAX_EDGE_FLIPS = 32  # maximum number of flips of an edge in a flip pass (cycle protection)
 
 class IntrinsicMesh:
   '''Supporting Halfedge Data Structure for intrinsic triangulations'''
 
   # create a intrinsic triangulation based on the extrinsic one provided
-  def __init__ (self, HE, mollification_factor=None):
+  # state is an optional dictionary, as returned by state(), to skip the preprocessing of the
+  # extrinsic mesh: lengths, narrow flags and lmin ('L', 'narrow', 'lmin'), and optionally a saved
+  # triangulation ('V', 'E', 'T', 'H', 'S', 'A'); its lists (or arrays) are used without copy
+  def __init__ (self, HE, mollification_factor=None, state=None):
     self.HE = HE # supporting extrinsic mesh
-    self.V = copy.deepcopy(HE.V)  # one halfedge index associated to vertex: he
-    self.E = copy.deepcopy(HE.E)  # the two halfedge indices that form the edge: [he0,he1]
-    self.T = copy.deepcopy(HE.T)  # one halfedge index associated to the triangle: he
-    self.H = copy.deepcopy(HE.H)  # vertex, edge, triangle, and next halfedge associated to halfedge: [v,e,t,he]
+    if state != None and 'H' in state:
+      # saved triangulation
+      self.V, self.E, self.T, self.H = state['V'], state['E'], state['T'], state['H']
+      self.S, self.A = state['S'], state['A']
+    else:
+      self.V = list(HE.V)  # one halfedge index associated to vertex: he
+      self.E = [list(e) for e in HE.E]  # the two halfedge indices that form the edge: [he0,he1]
+      self.T = list(HE.T)  # one halfedge index associated to the triangle: he
+      self.H = [list(h) for h in HE.H]  # vertex, edge, triangle, and next halfedge associated to halfedge: [v,e,t,he]
+      self.S = []  # supporting he associated to extrinsic halfedge: [h]
+      self.A = []  # supporting he angle associated to extrinsic halfedge: [phi]
     self.L = []  # edge length: l
-    self.S = []  # supporting he associated to extrinsic halfedge: [h]
-    self.A = []  # supporting he angle associated to extrinsic halfedge: [phi]
-
-
-    # compute edge lengths
-    for e in HE.E:
-      h0 = e[0] 
-      h1 = HE.next(h0)
-      v0 = HE.H[h0][0]  # first vertex
-      v1 = HE.H[h1][0]  # second vertex
-      self.L.append(HE.distance(v0,v1))
-    self.lmin = min(self.L)
-
-    # compute mollification
-    if mollification_factor:
-      self.mollification(mollification_factor)
-    # mark narrow vertices
-    self.mark_narrow_vertices(60/180*math.pi)
-
-    # set supporting halfedge information
-    # both triangulation are equal in the beginning
-    for he in range(len(HE.H)):
-      self.S.append(he)  # assign the intrinsic halfedge associated to the extrinsic halfedge 
-      self.A.append(0.0) # assign the intrinsic he angle w.r.t. the extrinsic halfedge
-    self.check_consistency()
+    self.observers = []  # objects notified about modified vertices (e.g. live matrices)
+    self.K = None  # live stiffness matrix (created on demand)
+    self.M = None  # live mass matrix (created on demand)
+    self.spectrum = None  # cached Laplacian eigenbasis (created on demand)
+    self.embedding = None # cached 3d embedding of the vertices (created on demand)
+    self.tracer = None    # cached polylines of the intrinsic edges (created on demand)
+    self.walker = None    # point location walker with coherent hinting (created on demand)
+    self.lazy = False     # deferred update of supporting information (see set_lazy)
+    self.sdirty = set()   # extrinsic vertices whose supporting information is not normalized
+    self.support = None   # supporting entries of each extrinsic vertex (created on demand)
+    self.counters = {'flips': 0, 'exact': 0, 'cycles': 0}  # flips, exact predicates, broken flip cycles
+    self.KC = None # live connection stiffness matrix (created on demand)
+    self.cone = None   # cached vertex angle sum: [theta] (created on demand)
+    self.ref = None    # cached halfedge reference angle w.r.t. the vertex halfedge: [phi]
+    self.apending = set()  # vertices whose cached angles are outdated
+
+    if state != None:
+      self.L = state['L']
+      self.narrow = state['narrow']
+      self.lmin = state['lmin']
+    else:
+      # compute edge lengths
+      for e in HE.E:
+        h0 = e[0] 
+        h1 = HE.next(h0)
+        v0 = HE.H[h0][0]  # first vertex
+        v1 = HE.H[h1][0]  # second vertex
+        self.L.append(HE.distance(v0,v1))
+      self.lmin = min(self.L)
+
+      # compute mollification
+      if mollification_factor:
+        self.mollification(mollification_factor)
+      # mark narrow vertices
+      self.mark_narrow_vertices(60/180*math.pi)
+
+    if state == None or 'H' not in state:
+      # set supporting halfedge information
+      # both triangulation are equal in the beginning
+      for he in range(len(HE.H)):
+        self.S.append(he)  # assign the intrinsic halfedge associated to the extrinsic halfedge 
+        self.A.append(0.0) # assign the intrinsic he angle w.r.t. the extrinsic halfedge
+    if state == None:
+      self.check_consistency()
+
+  # return the state of the triangulation as arrays (see the constructor)
+  # if connectivity is False, only the preprocessed data of the initial triangulation is returned
+  # (to be called before any modification): edge lengths, narrow flags and lmin
+  def state (self, connectivity=True):
+    self.repair_support()
+    state = {
+      'L': np.array(self.L,dtype='float64'),
+      'narrow': np.array(self.narrow,dtype=bool),
+      'lmin': float(self.lmin),
+    }
+    if connectivity:
+      state['V'] = np.array(self.V,dtype='int64')
+      state['E'] = np.array(self.E,dtype='int64').reshape(-1,2)
+      state['T'] = np.array(self.T,dtype='int64')
+      state['H'] = np.array(self.H,dtype='int64').reshape(-1,4)
+      state['S'] = np.array(self.S,dtype='int64')
+      state['A'] = np.array(self.A,dtype='float64')
+    return state
 
   # ensure li >= lj + lk + delta
   def mollification (self, delta):
@@ -149,6 +207,7 @@ class IntrinsicMesh:
     
   # check consistency of intrinsic triangles
   def check_consistency (self):
+    self.repair_support()
     for t, h0 in enumerate(self.T):
       h1 = self.next(h0)
       h2 = self.next(h1)
@@ -258,6 +317,7 @@ class IntrinsicMesh:
     for h in hlist:
       m = self.mate(h)
       self.update_insertion(m)
+    self.v_modified([v] + [self.H[self.mate(h)][0] for h in hlist])
     # mark modified triangles, if asked
     if tset:
       for h in hlist:
@@ -275,10 +335,62 @@ class IntrinsicMesh:
         flist.append(plist[i])
     return flist
 
+  # notify observers that the triangles around the given vertices were modified
+  def v_modified (self, vlist):
+    self.apending.update(vlist)
+    for obs in self.observers:
+      obs.touch(vlist)
+
+  # bring the cached vertex and reference angles up to date
+  def update_angle_cache (self):
+    if self.cone == None:
+      total, ref = self.reference_angle_arrays(*self.h_angle_arrays())
+      self.cone = total.tolist()
+      self.ref = ref.tolist()
+      self.apending.clear()
+      return
+    if not self.apending:
+      return
+    self.cone += [0.0] * (len(self.V)-len(self.cone))
+    self.ref += [0.0] * (len(self.H)-len(self.ref))
+    while self.apending:
+      self.v_update_angles(self.apending.pop())
+
+  # recompute the cached angle sum of a vertex and the reference angles of its halfedges
+  def v_update_angles (self, v):
+    h0 = h = self.V[v]
+    if h0 == -1:
+      return
+    a = 0
+    while True:
+      self.ref[h] = a
+      a += self.h_angle(h)
+      h = self.mate(self.previous(h))
+      if h == -1 or h == h0:
+        break
+    if h == -1:
+      b = 0
+      m = self.mate(h0)
+      while m != -1:
+        h = self.next(m)
+        b -= self.h_angle(h)
+        self.ref[h] = b
+        m = self.mate(h)
+      a -= b
+    self.cone[v] = a
+
   # atomic operation: update supporting information due to removal of an hafedge from vertex
   def update_removal (self, h):
     v = self.H[h][0]
     if v < len(self.HE.V):   # check if vertex correspond to a extrinsic one
+      if self.lazy:
+        self.sdirty.add(v)
+        for k in self.v_support(v):
+          if self.S[k] == h:
+            ref = self.next(self.mate(h))  # next of mate
+            self.S[k] = ref
+            self.A[k] -= self.h_angle(ref)
+        return
       helist = self.HE.adj_vh(v)
       # check for update in all incident extrinsic halfedges
       for he in helist:
@@ -291,6 +403,9 @@ class IntrinsicMesh:
   def update_insertion (self, h):
     v = self.H[h][0]
     if v < len(self.HE.V):   # check if vertex correspond to a extrinsic one
+      if self.lazy:
+        self.sdirty.add(v)
+        return
       helist = self.HE.adj_vh(v)
       # check for update in all incident extrinsic halfedges
       for he in helist:
@@ -300,7 +415,53 @@ class IntrinsicMesh:
           if (self.A[he] + theta) <= 0:
             self.S[he] = h 
             self.A[he] += theta
+
+  # atomic operation: update supporting information due to renumbering of a halfedge
+  def update_renumbering (self, h, hnew):
+    v = self.H[h][0]
+    if v < len(self.HE.V):   # check if vertex correspond to a extrinsic one
+      for he in self.HE.adj_vh(v):
+        if self.S[he] == h:
+          self.S[he] = hnew
   
+  # return the supporting entries of an extrinsic vertex: its extrinsic halfedges
+  def v_support (self, v):
+    if self.support == None:
+      self.support = [self.HE.adj_vh(i) for i in range(len(self.HE.V))]
+    return self.support[v]
+
+  # deferred mode: normalize the supporting information of the modified extrinsic vertices
+  # while in deferred mode, update_removal keeps the supporting halfedges valid but the
+  # insertions are not applied: the supporting angles may exceed the supporting wedges,
+  # and each supporting halfedge is advanced counterclockwise until its angle fits
+  def repair_support (self):
+    for v in self.sdirty:
+      for k in self.v_support(v):
+        ref = self.S[k]
+        phi = self.A[k]
+        while True:
+          theta = self.h_angle(ref)
+          h = self.mate(self.previous(ref))
+          if h == -1 or phi + theta > 0:
+            break
+          ref = h
+          phi += theta
+        self.S[k] = ref
+        self.A[k] = phi
+    self.sdirty.clear()
+
+  # enable or disable the deferred update of supporting information:
+  # in deferred mode, topology operations only record the modified extrinsic vertices
+  # and their supporting information is recomputed at once by repair_support, which is
+  # called before any query (point location, common subdivision, consistency check)
+  # return the previous mode
+  def set_lazy (self, flag):
+    lazy = self.lazy
+    if not flag:
+      self.repair_support()
+    self.lazy = flag
+    return lazy
+
   # find vi in the star of v; return the halfedge from vi to v
   def find_vv (self, v, vi):
     l = self.adj_vh(v)
@@ -431,6 +592,7 @@ class IntrinsicMesh:
 
     self.update_insertion(h0)
     self.update_insertion(h1)
+    self.v_modified([v0,v1,w0,w1])
 
     return True
   
@@ -465,9 +627,15 @@ class IntrinsicMesh:
     #if self.H[self.previous(h0)][0] == self.H[self.previous(h1)][0]:
     #  return True
 
-    a = self.t_opposite_angle(h0)
-    b = self.t_opposite_angle(h1)
-    return a + b <= math.pi + 1e-5
+    # sum of opposite angles not larger than pi (+ 1e-5), from edge lengths
+    n0 = self.next(h0)
+    n1 = self.next(h1)
+    legal, exact = utl.delaunay_len(self.L[e],
+                                    self.L[self.H[n0][1]],self.L[self.H[self.next(n0)][1]],
+                                    self.L[self.H[n1][1]],self.L[self.H[self.next(n1)][1]])
+    if exact:
+      self.counters['exact'] += 1
+    return legal
   
   # convert triangution into Delaunay 
   # return number of edge flips
@@ -476,18 +644,35 @@ class IntrinsicMesh:
     eset = {}
     for i in range(0,len(self.E)):
       eset[i] = True
-    n += self.delaunay_flip(eset)
+    lazy = self.set_lazy(True)
+    try:
+      n += self.delaunay_flip(eset)
+    finally:
+      self.set_lazy(lazy)
     return n
 
   # check Delaunay condition for the queued edges
   # if triangle set is provided, collect all affected triangles
   # return number of performed flips
+  # an edge is not flipped back to a previous configuration, nor more than MAX_EDGE_FLIPS times
   def delaunay_flip (self, eset, tset=None): 
     n = 0 
+    history = {}  # endpoints taken by each flipped edge
     while eset:
       e,_ = eset.popitem() 
       if not self.e_legal(e):
+        h0 = self.E[e][0]
+        h1 = self.E[e][1]
+        seen = history.setdefault(e,set())
+        if not seen:
+          seen.add(frozenset((self.H[h0][0],self.H[h1][0])))
+        ends = frozenset((self.H[self.previous(h0)][0],self.H[self.previous(h1)][0]))
+        if ends in seen or len(seen) > MAX_EDGE_FLIPS:
+          self.counters['cycles'] += 1
+          continue
+        seen.add(ends)
         self.swapedge(e)
+        self.counters['flips'] += 1
         n += 1
         h0 = self.E[e][0]
         h1 = self.E[e][1]
@@ -511,6 +696,154 @@ class IntrinsicMesh:
     for i in range(n):
       for v in range(len(self.HE.V),len(self.V)):
         self.vertex_displacement(v)
+
+  # smooth the inserted vertices in batches of non adjacent vertices (see Smoother)
+  # kind is 'odt' (circumcenters, as vertex_displacement) or 'lloyd' (barycenters)
+  # iterate until the maximum displacement relative to the average edge length is less than tol
+  # return the statistics of each iteration and whether tol was reached (see Smoother.run)
+  def smooth (self, niter=10, tol=1e-3, kind='odt', delaunay=True):
+    return Smoother(self,kind).run(niter,tol,delaunay)
+
+  # remove an inserted (non extrinsic) vertex not on border
+  # the vertex is flipped down to degree 3 and then collapsed, and the Delaunay
+  # property is restored at the modified region; the entity arrays are compacted
+  # return True if the vertex was removed
+  def v_remove (self, v):
+    if v < len(self.HE.V):
+      return False # extrinsic vertex cannot be removed
+    if self.border_h(v) != -1:
+      return False # vertex on border cannot be removed
+    eset = {}
+    # flip incident edges while the vertex degree is greater than 3
+    while True:
+      hlist = self.adj_vh(v)
+      if len(hlist) <= 3:
+        break
+      flipped = False
+      for h in hlist:
+        m = self.mate(h)
+        # the quadrilateral must be convex at both vertices of the edge
+        if (self.h_angle(h) + self.h_angle(self.next(m)) < math.pi - 1e-8 and
+            self.h_angle(m) + self.h_angle(self.next(h)) < math.pi - 1e-8):
+          e = self.H[h][1]
+          self.swapedge(e)
+          h0 = self.E[e][0]
+          h1 = self.E[e][1]
+          eset[e] = True
+          for hi in [self.next(h0),self.previous(h0),self.next(h1),self.previous(h1)]:
+            eset[self.H[hi][1]] = True
+          flipped = True
+          break
+      if not flipped:
+        self.delaunay_flip(eset)
+        return False
+    # collapse the degree 3 vertex: triangles (v,w[i],w[i+1]) are replaced by (w[0],w[1],w[2])
+    h0 = self.V[v]
+    hlist = [h0]
+    for i in range(2):
+      hlist.append(self.mate(self.previous(hlist[-1])))
+    plist = [self.previous(h) for h in hlist]  # halfedges w[i+1] -> v
+    olist = [self.next(h) for h in hlist]      # halfedges w[i] -> w[i+1]
+    wlist = [self.H[h][0] for h in olist]
+    # simulate removing halfedges to update supporting information
+    for h in hlist:
+      self.update_removal(self.mate(h))
+    t = self.H[h0][2]
+    for i in range(3):
+      self.H[olist[i]][2:] = [t, olist[(i+1)%3]]
+      self.V[wlist[i]] = olist[i]
+      eset[self.H[olist[i]][1]] = True
+    self.T[t] = olist[0]
+    elist = [self.H[h][1] for h in hlist]
+    for e in elist:
+      eset.pop(e,None)
+    self.v_modified(wlist)
+    self.delaunay_flip(eset)
+    # compact entity arrays
+    self.compact([v],hlist+plist,elist,[self.H[h][2] for h in hlist[1:]])
+    return True
+
+  # remove entities, moving the last ones to the released positions
+  # the entities to be removed must be already disconnected from the mesh
+  # (references to vertices, halfedges, edges and triangles are updated)
+  def compact (self, vlist, hlist, elist, tlist):
+    self.repair_support()
+    for h in sorted(hlist,reverse=True):
+      last = len(self.H) - 1
+      if h != last:
+        p = self.previous(last)
+        self.H[p][3] = h
+        e = self.H[last][1]
+        self.E[e] = [h if x == last else x for x in self.E[e]]
+        if self.T[self.H[last][2]] == last:
+          self.T[self.H[last][2]] = h
+        if self.V[self.H[last][0]] == last:
+          self.V[self.H[last][0]] = h
+        self.update_renumbering(last,h)
+        self.H[h] = self.H[last]
+      self.H.pop()
+    for e in sorted(elist,reverse=True):
+      last = len(self.E) - 1
+      if e != last:
+        for h in self.E[last]:
+          if h != -1:
+            self.H[h][1] = e
+        self.E[e] = self.E[last]
+        self.L[e] = self.L[last]
+      self.E.pop()
+      self.L.pop()
+    for t in sorted(tlist,reverse=True):
+      last = len(self.T) - 1
+      if t != last:
+        for h in self.t_halfedges(last):
+          self.H[h][2] = t
+        self.T[t] = self.T[last]
+      self.T.pop()
+    for v in sorted(vlist,reverse=True):
+      last = len(self.V) - 1
+      if v != last:
+        for h in self.adj_vh(last):
+          self.H[h][0] = v
+        self.V[v] = self.V[last]
+      self.V.pop()
+    self.renumbered()
+
+  # notify observers that entities were renumbered (data associated to entities is recomputed)
+  def renumbered (self):
+    for o in self.observers:
+      o.reset()
+    self.sdirty.clear()
+    self.cone = None
+    self.ref = None
+    self.apending.clear()
+
+  # remove inserted vertices that are not needed to keep the minimum angle amin:
+  # a vertex is removed if its star can be retriangulated with angles not less than amin
+  # return the number of removed vertices
+  def coarsen (self, amin):
+    n = 0
+    for v in range(len(self.V)-1,len(self.HE.V)-1,-1):
+      if v >= len(self.V) or self.border_h(v) != -1:
+        continue
+      # compute layout position of star, assuming v at (0,0)
+      plist = []
+      phi = 0
+      hlist = [self.V[v]]
+      while True:
+        h = hlist[-1]
+        e = self.H[h][1]
+        l = self.L[e]
+        plist.append([l*math.cos(phi),l*math.sin(phi)])
+        phi += self.h_angle(h)
+        h = self.mate(self.previous(h))
+        if h == hlist[0]:
+          break
+        hlist.append(h)
+      if utl.polygon_maxmin_angle(plist) < amin:
+        continue
+      if self.v_remove(v):
+        n += 1
+    return n
   
   # get the angles of a triangle
   def t_get_angles (self, t):
@@ -707,6 +1040,7 @@ class IntrinsicMesh:
   # return two lists: tlist = [t_id,...], clist = [[[x,y,z],[x,y,z],[x,y,z]],...]
   # if flag_3d is False, the coordiantes are in 2d, clist = [[[x,y],[x,y],[x,y]],...]
   def get_overlapping_triangles (self, te, p, flag_3d):
+    self.repair_support()
     he = self.HE.T[te]
     h0 = self.S[he]
     phi0 = self.A[he]
@@ -767,18 +1101,103 @@ class IntrinsicMesh:
     for te in range(0,len(self.HE.T)):
       if feedback:
         print(te)
-      ce = self.te_flatten(te)
-      trace = self.collect_overlapping_triangles(te,ce,mark)
-      for t, v in trace:
-        out = utl.clip(ce,v)   # get intersection between the two triangles
-        if out:
-          uv = self.to_baricentric(ce,out)
-          tcoord = self.to_3d_triangles(te,uv)
-          elist += [te] * len(tcoord)
-          ilist += [t] * len(tcoord)
-          clist += tcoord
+      il, cl = self.te_common_subdivision(te,mark)
+      elist += [te] * len(il)
+      ilist += il
+      clist += cl
     return elist, ilist, clist
 
+  # generate the common subdivision restricted to one extrinsic triangle
+  # mark is the list of marks of intrinsic triangles shared by successive calls
+  # return two lists: ilist = [ti_id, ...], clist = [[[x,y,z],[x,y,z],[x,y,z]],...]
+  def te_common_subdivision (self, te, mark):
+    ilist = []
+    clist = []
+    ce = self.te_flatten(te)
+    trace = self.collect_overlapping_triangles(te,ce,mark)
+    for t, v, h in trace:
+      out = utl.clip(ce,v)   # get intersection between the two triangles
+      if out:
+        uv = self.to_baricentric(ce,out)
+        tcoord = self.to_3d_triangles(te,uv)
+        ilist += [t] * len(tcoord)
+        clist += tcoord
+    return ilist, clist
+
+  # locate all vertices on the extrinsic mesh
+  # return two lists: the extrinsic triangle of each vertex (-1 for isolated vertices) and the
+  # barycentric coordinates w.r.t. its vertices (in the order of te_flatten)
+  # inserted vertices are located in the overlapping triangles of each extrinsic triangle;
+  # a vertex on an extrinsic edge is assigned to the triangle with largest minimum coordinate
+  def v_locations (self):
+    HE = self.HE
+    ne = len(HE.V)
+    tlist = [-1] * len(self.V)
+    blist = [[0.0,0.0,0.0] for v in range(len(self.V))]
+    score = [-math.inf] * len(self.V)
+    for v in range(ne):
+      h = HE.V[v]
+      if h == -1:
+        continue
+      te = HE.H[h][2]
+      b = [0.0,0.0,0.0]
+      b[[HE.H[hi][0] for hi in self.te_halfedges(te)].index(v)] = 1.0
+      tlist[v] = te
+      blist[v] = b
+    mark = [-1 for i in range(0,len(self.T))]
+    for te in range(0,len(HE.T)):
+      ce = self.te_flatten(te)
+      for t, p, h in self.collect_overlapping_triangles(te,ce,mark):
+        for k in range(3):
+          v = self.H[h][0]
+          h = self.next(h)
+          if v < ne:
+            continue
+          uv = self.to_baricentric(ce,[p[k]])[0]
+          b = [uv[0],uv[1],1-uv[0]-uv[1]]
+          if min(b) > score[v]:
+            score[v] = min(b)
+            tlist[v] = te
+            blist[v] = b
+    return tlist, blist
+
+  # return the halfedges of an extrinsic triangle
+  def te_halfedges (self, te):
+    h0 = self.HE.T[te]
+    h1 = self.HE.next(h0)
+    h2 = self.HE.next(h1)
+    return [h0,h1,h2]
+
+  # return the cached 3d embedding of the vertices, creating it if needed
+  def get_embedding (self):
+    if self.embedding == None:
+      self.embedding = Embedding(self)
+    return self.embedding
+
+  # return the 3d position of all vertices (n x 3); inserted vertices are placed at their
+  # location on the extrinsic mesh, kept up to date by the cached embedding
+  def v_positions (self):
+    return self.get_embedding().positions()
+
+  # return the cached tracer of the intrinsic edges, creating it if needed
+  def get_edge_tracer (self):
+    if self.tracer == None:
+      self.tracer = EdgeTracer(self)
+    return self.tracer
+
+  # return all intrinsic edges traced over the extrinsic mesh as 3d polylines, in flat arrays:
+  # offsets (|E|+1) and points; the polyline of edge e is points[offsets[e]:offsets[e+1]]
+  def e_polylines (self):
+    return self.get_edge_tracer().polylines()
+
+  # return the supporting information at an extrinsic vertex: an extrinsic halfedge leaving the
+  # vertex, its supporting intrinsic halfedge and angle (see te_point_location), or None
+  def v_anchor (self, v):
+    he = self.HE.V[v]
+    if he == -1:
+      return None
+    return he, self.S[he], self.A[he]
+
   # collect all overlapping triangles
   def collect_overlapping_triangles (self, te, ce, mark):
     trace, front = self.trace_perimeter(te,ce,mark)
@@ -796,7 +1215,7 @@ class IntrinsicMesh:
           (v0[1]+v1[1]+v2[1])/3,
         ]
         if utl.in_triangle(ce,gc):
-          trace.append((t,[v0,v1,v2]))
+          trace.append((t,[v0,v1,v2],h0))
           mark[t] = te
           front.append((v2,m1,phi1+math.pi))
           front.append((v0,m2,phi2+math.pi))
@@ -827,9 +1246,10 @@ class IntrinsicMesh:
   # trace triangle perimeter,
   # while collecting halfedge to an advancing front procedure
   # returns two dictionary:
-  #  traced triangles: [t] = [v0,v1,v2]
+  #  traced triangles: (t, [v0,v1,v2], h0), with v0 at the origin of halfedge h0
   #  front triangles: [h0] = (v0,phi0)
   def trace_perimeter (self, te, ce, mark):  # <-- trace, front
+    self.repair_support()
     trace = []                # collect all visited triangles (without duplication)
     front = []                # collect all advancing-front triangles (without duplication)
     h0e = self.HE.T[te]
@@ -861,7 +1281,7 @@ class IntrinsicMesh:
         v1, v2, phi1, phi2 = self.compute_flattern(v0,h0,phi0,v1)
         # mark triangle as traced
         t = self.H[h0][2]
-        trace.append((t,[v0,v1,v2]))
+        trace.append((t,[v0,v1,v2],h0))
         mark[t] = te
         # check if target was reached
         h1 = self.next(h0)
@@ -923,17 +1343,28 @@ class IntrinsicMesh:
         v1,v2,phi1,phi2 = self.compute_flattern(v0,h0,phi0)
         t = self.H[h0][2]
         if mark[t] != te:
-          trace.append((t,[v0,v1,v2]))
+          trace.append((t,[v0,v1,v2],h0))
           mark[t] = te
     return trace, front
   
+  # return the supporting halfedge and angle of an extrinsic triangle (see te_point_location)
+  def te_support (self, te):
+    he = self.HE.T[te]
+    return self.S[he], self.A[he]
+
+  # return the point location walker, creating it if needed; successive queries in the same
+  # extrinsic triangle start from the previously located triangle (see Walker)
+  def get_walker (self):
+    if self.walker == None:
+      self.walker = Walker(self)
+    return self.walker
+
   # procedure to locate point at the intrinsic mesh inside a extrinsic triangle given its baricentric coordinate
   def te_point_location (self, te, uvw):   #  <-- he, uvw_i
-    he = self.HE.T[te]
+    self.repair_support()
     v = self.te_flatten(te)
     p = utl.from_baricentric(v[0],v[1],v[2],uvw)
-    h0 = self.S[he]
-    phi0 = self.A[he]
+    h0, phi0 = self.te_support(te)
     return self.point_location(p,h0,phi0)
 
   # procedure to locate point p in 2d space.
@@ -941,10 +1372,19 @@ class IntrinsicMesh:
   # h0 is the halfedge anchored at the origin with angle
   # equal to phi0 wrt the x axis. 
   def point_location (self, p, h0, phi0):  # <-- h0, uvw
+    h0, uvw, v0, phi0, steps = self.walk(p,h0,phi0)
+    return h0, uvw
+
+  # walk from the halfedge h0, anchored at the origin with angle phi0 wrt the x axis, to the
+  # triangle that contains the point p (as point_location)
+  # return the halfedge of the triangle, the baricentric coordinates of p, the layout of the
+  # halfedge (origin and angle wrt the x axis) and the number of crossed edges
+  def walk (self, p, h0, phi0):
     e0 = self.H[h0][1]
     l0 = self.L[e0]
     v0 = [0, 0]
     v1 = [l0*math.cos(phi0) ,l0*math.sin(phi0)];
+    steps = 0
     while True:
       # compute v2
       h1 = self.next(h0)
@@ -966,6 +1406,7 @@ class IntrinsicMesh:
           l0 = l1
           h0 = m1
           phi0 = phi1 + math.pi
+          steps += 1
           continue 
       elif (not utl.ccw(v2,v0,p)):
         m2 = self.mate(h2)
@@ -975,13 +1416,14 @@ class IntrinsicMesh:
           l0 = l2
           h0 = m2
           phi0 = phi0 + beta
+          steps += 1
           continue; 
       a = utl.area(v0,v1,v2)
       uvw = [0,0,0]
       uvw[0] = utl.area(p,v1,v2) / a
       uvw[1] = utl.area(p,v2,v0) / a
       uvw[2] = 1 - uvw[0] - uvw[1]
-      return h0, uvw
+      return h0, uvw, v0, phi0, steps
   
   def te_flatten (self, t):
     h0 = self.HE.T[t]
@@ -1023,15 +1465,19 @@ class IntrinsicMesh:
 
   # refine triangle if it minimun angle is less than amin,
   # maintaing the delaunay property
-  def t_refine_if (self, t, amin, eset, tset):
+  def t_refine_if (self, t, amin, eset, tset, policy='circumcenter'):
     TOL = 1e-4
     a = self.t_get_angles(t)
     if min(a) >= amin:
       return
-    h0 = self.T[t]
-    v = self.t_flatten(h0)
-    c = utl.circumcenter(v[0],v[1],v[2])
-    h0, uvw = self.point_location(c,h0,0)
+    if policy == 'circumcenter':
+      h0 = self.T[t]
+      v = self.t_flatten(h0)
+      c = utl.circumcenter(v[0],v[1],v[2])
+      h0, uvw = self.point_location(c,h0,0)
+    else:
+      h0, uvw = self.t_steiner_location(t,policy,amin)
+    v = None
     if min(uvw) < TOL:
       if max(uvw) > 1-TOL:
         return # point at a vertex; nothing to do (unexpected)
@@ -1041,12 +1487,14 @@ class IntrinsicMesh:
         if uvw[i] < TOL:
           # vertex on opposite edge
           n = self.next(h)
-          self.e_refine(n,uvw[(i+1)%3],eset,tset)
+          v = self.e_refine(n,uvw[(i+1)%3],eset,tset)
           break
         h = self.next(h)
     else:
       # refine triangle
-      self.t_refine(h0,uvw,eset,tset)
+      v = self.t_refine(h0,uvw,eset,tset)
+    if v != None:
+      self.t_requeue(t,policy,tset)
 
   # refine a triangle
   # insert the point at uvw in the triangle, forming two new triangles
@@ -1103,6 +1551,7 @@ class IntrinsicMesh:
     self.update_insertion(h01)
     self.update_insertion(h11)
     self.update_insertion(h21)
+    self.v_modified([v0,v1,v2,v])
     #self.vertex_displacement(v) # TODO: was commented
     tset[t] = True
     tset[t0] = True
@@ -1185,6 +1634,7 @@ class IntrinsicMesh:
       self.H.append([v, e, t1l, n1])    # m0
       self.E.append([h10, h11])  # e1
       self.L.append(utl.distance(c[3],p)) # e1
+    self.v_modified([self.H[h0][0],self.H[n0][0],v2,v] + ([v3] if h1 != -1 else []))
     if h1 != -1:
       self.update_insertion(h01)
       self.update_insertion(h11)
@@ -1208,18 +1658,26 @@ class IntrinsicMesh:
 
   # refine triangulation maintaining delaunay property
   # eliminate all angles less than amin
-  def refine_mesh (self, amin):
+  # policy selects the Steiner point (see t_steiner_location)
+  # return the number of inserted vertices
+  def refine_mesh (self, amin, policy='circumcenter'):
+    nv = len(self.V)
     tset = {}
     eset = {}
     for i in range(0,len(self.T)):
       tset[i] = True
-    self.delaunay_refine(amin, eset,tset)
+    lazy = self.set_lazy(True)
+    try:
+      self.delaunay_refine(amin, eset,tset,policy)
+    finally:
+      self.set_lazy(lazy)
+    return len(self.V) - nv
 
   # refine keeping Delaunay condition
-  def delaunay_refine (self, amin, eset, tset):
+  def delaunay_refine (self, amin, eset, tset, policy='circumcenter'):
     while tset:
       t,_ = tset.popitem()
-      self.t_refine_if(t,amin,eset,tset)
+      self.t_refine_if(t,amin,eset,tset,policy)
       self.delaunay_flip(eset,tset)
 
   # compute the area of influence of a vertex for Laplacian matrix,
@@ -1254,41 +1712,55 @@ class IntrinsicMesh:
       [b/2,a/2,-(a+b)/2]
     ]
 
-  # compute connection Laplacian matrix
-  def LaplacianMatrix (self):
-    n = len(self.V)
-    L = scipy.sparse.lil_matrix((n,n),dtype='float64')
-    for t in range(len(self.T)):
-      h0 = self.T[t]
+  # compute the row of the cotangent stiffness matrix associated to vertex v
+  # (same entries as the per triangle matrix t_laplacian)
+  # return the column indices and values (repeated indices are summed)
+  def v_stiffness_row (self, v):
+    cols = [v]
+    vals = [0]
+    for h0 in self.adj_vh(v):
       h1 = self.next(h0)
       h2 = self.next(h1)
-      v0 = self.H[h0][0]
-      v1 = self.H[h1][0]
-      v2 = self.H[h2][0]
-      m = self.t_laplacian(t)
-      L[v0,v0] += m[0][0]
-      L[v0,v1] += m[0][1]
-      L[v0,v2] += m[0][2]
-      L[v1,v0] += m[1][0]
-      L[v1,v1] += m[1][1]
-      L[v1,v2] += m[1][2]
-      L[v2,v0] += m[2][0]
-      L[v2,v1] += m[2][1]
-      L[v2,v2] += m[2][2]
-    return L
+      b = 1/math.tan(self.h_angle(h1))
+      c = 1/math.tan(self.h_angle(h2))
+      cols += [self.H[h1][0], self.H[h2][0]]
+      vals += [c/2, b/2]
+      vals[0] -= (b+c)/2
+    return cols, vals
+
+  # compute the row of the lumped mass matrix associated to vertex v
+  def v_mass_row (self, v):
+    return [v], [self.cot_area(self.adj_vh(v))]
+
+  # return the live stiffness matrix, creating it if needed
+  def get_stiffness (self):
+    if self.K == None:
+      self.K = LMatrix(self,self.v_stiffness_row)
+    return self.K
+
+  # return the live mass matrix, creating it if needed
+  def get_mass (self):
+    if self.M == None:
+      self.M = LMatrix(self,self.v_mass_row)
+    return self.M
+
+  # return sparse cotangent stiffness matrix in csr format
+  # the matrix is kept by the mesh and only the modified rows are recomputed
+  def StiffnessMatrix (self):
+    return self.get_stiffness().matrix()
+
+  # return sparse lumped mass matrix in csr format
+  def MassMatrix (self):
+    return self.get_mass().matrix()
+
+  # compute Laplacian matrix in lil format
+  def LaplacianMatrix (self):
+    return self.StiffnessMatrix().tolil()
 
   # return sparse Diffusion matrix in lil format
   # M = (I - gamma h L), assuming gamma = 1
   def DiffusionMatrix (self, t=1):
-    M = self.LaplacianMatrix()
-    row, col = M.nonzero()
-    for i, j in zip(row,col):
-      M[i,j] *= -t
-    for v in range(len(self.V)):
-      star = self.adj_vh(v)
-      Mii = self.cot_area(star)
-      M[v,v] = Mii + M[v,v]
-    return M
+    return (self.MassMatrix() - t * self.StiffnessMatrix()).tolil()
 
   # simulate heat diffusion
   # Ti is a dictionary (v, T) represent initial temperatures at vertices
@@ -1305,9 +1777,42 @@ class IntrinsicMesh:
       b[i] = T
     return scipy.sparse.linalg.spsolve(A.tocsr(),b)
 
+  # simulate heat diffusion over time with a fixed time step dt
+  # Ti is a dictionary (v, T) represent initial temperatures at vertices
+  # generate nsteps frames: (temperatures at intrinsic vertices, temperatures at extrinsic vertices)
+  # the system is factorized once; crank_nicolson selects the second order scheme
+  # (instead of backward Euler) and fixed keeps the source temperatures along the simulation
+  def HeatSteps (self, Ti, dt, nsteps, crank_nicolson=False, fixed=False):
+    return HeatStepper(self,Ti,dt,crank_nicolson,fixed).frames(nsteps)
+
+  # return the spectral decomposition of the Laplacian, creating it if needed
+  # method is 'shift-invert' or 'lobpcg'
+  def get_spectrum (self, method=None):
+    if self.spectrum == None:
+      self.spectrum = Spectrum(self)
+    if method != None:
+      self.spectrum.method = method
+    return self.spectrum
+
+  # return the k smallest generalized eigenpairs of (-K, M): eigenvalues (k) and eigenvectors (n x k)
+  # the eigenbasis is cached while the mesh is not modified and extended on demand
+  def Eigenpairs (self, k, method=None):
+    return self.get_spectrum(method).eigenpairs(k)
+
+  # simulate heat diffusion using the k smallest eigenpairs
+  # Ti is a dictionary (v, T) represent initial temperatures at vertices
+  # t is a time value or a list of time values (one column per time value)
+  def SpectralHeatDiffusion (self, Ti, t=1, k=100):
+    return self.get_spectrum().heat(Ti,t,k)
+
+  # return the cached angle sum of a vertex
+  def v_cone_angle (self, v):
+    self.update_angle_cache()
+    return self.cone[v]
+
   # normalize angle of a vertex
   def normalize_angle (self, v, angle):
-    total = self.v_angle(v)
+    total = self.v_cone_angle(v)
     angle %= total 
     #if angle < 0:
       #angle += total
@@ -1318,24 +1823,13 @@ class IntrinsicMesh:
     angle %= 2 * math.pi
     #if angle < 0:
       #angle += 2 * math.pi
-    return angle * self.v_angle(v) / 2 / math.pi
+    return angle * self.v_cone_angle(v) / 2 / math.pi
 
   # return the angle between the halfedge and the halfedge associated to the associated vertex
+  # (ccw from the vertex halfedge, or cw, negative, if the walk reaches the border)
   def h_reference_angle (self, h):
-    v = self.H[h][0]
-    h0 = self.V[v]  # reference axis
-    hi = h0
-    angle = 0
-    while hi != -1 and hi != h:
-      angle += self.h_angle(hi)
-      hi = self.mate(self.previous(hi))
-    if hi == -1:
-      hi = h0
-      angle = 0
-      while hi != h: 
-        hi = self.next(self.mate(hi))
-        angle -= self.h_angle(hi)
-    return angle 
+    self.update_angle_cache()
+    return self.ref[h]
 
   # compute edge rotation
   def edge_rotation (self, h):
@@ -1365,63 +1859,141 @@ class IntrinsicMesh:
       [b*r20/2,a*r12.conjugate()/2,-(a+b)/2]
     ]
 
-  # compute connection Laplacian matrix
-  def ConnectionLaplacianMatrix (self):
-    n = len(self.V)
-    L = scipy.sparse.lil_matrix((n,n),dtype="complex128")
-    for t in range(len(self.T)):
-      h0 = self.T[t]
+  # compute the row of the connection Laplacian matrix associated to vertex v
+  # (same entries as the per triangle matrix t_connection_laplacian)
+  def v_connection_row (self, v):
+    cols = [v]
+    vals = [complex(0)]
+    for h0 in self.adj_vh(v):
       h1 = self.next(h0)
       h2 = self.next(h1)
-      v0 = self.H[h0][0]
-      v1 = self.H[h1][0]
-      v2 = self.H[h2][0]
-      m = self.t_connection_laplacian(t)
-      L[v0,v0] += m[0][0]
-      L[v0,v1] += m[0][1]
-      L[v0,v2] += m[0][2]
-      L[v1,v0] += m[1][0]
-      L[v1,v1] += m[1][1]
-      L[v1,v2] += m[1][2]
-      L[v2,v0] += m[2][0]
-      L[v2,v1] += m[2][1]
-      L[v2,v2] += m[2][2]
-    return L
-
-
-  # compute vector diffusion matrix
+      b = 1/math.tan(self.h_angle(h1))
+      c = 1/math.tan(self.h_angle(h2))
+      ro_01 = -self.edge_rotation(h0)
+      ro_20 = -self.edge_rotation(h2)
+      r01 = complex(math.cos(ro_01),math.sin(ro_01))
+      r20 = complex(math.cos(ro_20),math.sin(ro_20))
+      cols += [self.H[h1][0], self.H[h2][0]]
+      vals += [c*r01/2, b*r20.conjugate()/2]
+      vals[0] -= (b+c)/2
+    return cols, vals
+
+  # compute, in array form, the angle and the mate of all halfedges
+  # return three arrays: H (nh x 4), mate (nh), angle (nh)
+  def h_angle_arrays (self):
+    H = np.array(self.H,dtype='int64').reshape(-1,4)
+    E = np.array(self.E,dtype='int64').reshape(-1,2)
+    L = np.array(self.L,dtype='float64')
+    ids = np.arange(len(H))
+    e = E[H[:,1]]
+    mate = np.where(e[:,0] == ids, e[:,1], e[:,0])
+    n = H[:,3]
+    l0 = L[H[:,1]]
+    l1 = L[H[n,1]]
+    l2 = L[H[n[n],1]]
+    c = np.clip((l0*l0+l2*l2-l1*l1)/(2*l0*l2),-1,1)
+    return H, mate, np.arccos(c)
+
+  # compute, in array form, the angle sum of all vertices (v_angle) and
+  # the reference angle of all halfedges (h_reference_angle)
+  # the rings of all vertices are walked simultaneously
+  def reference_angle_arrays (self, H, mate, angle):
+    nh = len(H)
+    total = np.bincount(H[:,0],weights=angle,minlength=len(self.V))
+    ref = np.zeros(nh)
+    prev = H[H[:,3],3]
+    start = np.array(self.V,dtype='int64')
+    start = start[start != -1]
+    # walk ccw from the vertex reference halfedge
+    h = start
+    acc = np.zeros(len(h))
+    border = np.zeros(0,dtype='int64')
+    while len(h):
+      ref[h] = acc
+      acc = acc + angle[h]
+      s = start
+      h = mate[prev[h]]
+      border = np.concatenate((border,s[h == -1]))
+      keep = (h != -1) & (h != s)
+      h = h[keep]
+      acc = acc[keep]
+      start = s[keep]
+    # walk cw from the reference halfedge of vertices on border
+    h = border
+    acc = np.zeros(len(h))
+    while len(h):
+      m = mate[h]
+      keep = m != -1
+      h = H[m[keep],3]
+      acc = acc[keep] - angle[h]
+      ref[h] = acc
+    return total, ref
+
+  # assemble the connection Laplacian matrix in array form
+  # (same entries as the per triangle matrix t_connection_laplacian)
+  # return the matrix in csr format
+  def assemble_connection_laplacian (self):
+    H, mate, angle = self.h_angle_arrays()
+    self.update_angle_cache()
+    total = np.array(self.cone)
+    ref = np.array(self.ref)
+    n = H[:,3]
+    p = H[n,3]
+    v = H[:,0]
+    # transport rotation along each halfedge (edge_rotation)
+    phi_ij = np.mod(ref,total[v]) * 2 * math.pi / total[v]
+    phi_ji = np.mod(ref[n]+angle[n],total[v[n]]) * 2 * math.pi / total[v[n]]
+    r = np.exp(-1j * (phi_ji + math.pi - phi_ij))
+    cot = 1 / np.tan(angle)
+    b = cot[n]
+    c = cot[p]
+    I = np.concatenate((v,v,v))
+    J = np.concatenate((v,v[n],v[p]))
+    X = np.concatenate((-(b+c)/2, c*r/2, b*np.conj(r[p])/2))
+    nv = len(self.V)
+    return scipy.sparse.csr_matrix((X,(I,J)),shape=(nv,nv))
+
+  # return the live connection Laplacian matrix, creating it if needed
+  # rows depend on the tangent frames of the neighbor vertices
+  def get_connection (self):
+    if self.KC == None:
+      self.KC = LMatrix(self,self.v_connection_row,"complex128",True,
+                        self.assemble_connection_laplacian)
+    return self.KC
+
+  # compute connection Laplacian matrix in csr format
+  # the matrix is kept by the mesh and only the modified rows are recomputed
+  def ConnectionLaplacianMatrix (self):
+    return self.get_connection().matrix()
+
+  # compute vector diffusion matrix in lil format
   def VectorDiffusionMatrix (self, t=1):
-    M = self.ConnectionLaplacianMatrix()
-    row, col = M.nonzero()
-    for i, j in zip(row,col):
-      M[i,j] *= -t
-    for v in range(len(self.V)):
-      star = self.adj_vh(i)
-      Mii = self.cot_area(star)
-      M[v,v] = Mii + M[v,v]
-    
-    return M
+    return (self.MassMatrix() - t * self.ConnectionLaplacianMatrix()).tolil()
 
   # normalized angle from extrinsic vertex halfedge to intrinsic vertex halfedge
+  # the supporting halfedge of the extrinsic vertex halfedge is at angle A w.r.t. it,
+  # and at the cached reference angle w.r.t. the intrinsic vertex halfedge
   def transfer_angle (self, v):
-    THETA = self.v_angle(v)
+    self.repair_support()
     he_v = self.HE.V[v]
-    h_v = self.V[v]
-    h = self.S[he_v]
-    theta = self.A[he_v] / THETA
-    while h != h_v:
-      theta += self.h_angle / THETA
-      h = self.mate(self.previous(h))
-    return theta
+    return self.normalize_angle(v,self.A[he_v] - self.h_reference_angle(self.S[he_v]))
 
   # copy vector data: copy vector data to extrinsic vertices
+  # result is an array with one value per intrinsic vertex, (n) or (n x k)
+  # return a complex array with the values at the extrinsic vertices
   def CopyVectorData (self, result):
-    re = []   # result at extrinsic vertices
-    for v in range(len(self.HE.V)):
-      theta = self.transfer_angle(v)
-      r = complex(math.cos(theta),math.sin(theta))
-      re.append(result[v] * r)
-    return re
+    self.repair_support()
+    self.update_angle_cache()
+    ne = len(self.HE.V)
+    he_v = np.array(self.HE.V)
+    total = np.array(self.cone[0:ne])
+    S = np.array(self.S)[he_v]
+    theta = np.mod(np.array(self.A)[he_v] - np.array(self.ref)[S],total) * 2 * math.pi / total
+    r = np.exp(1j * theta)
+    result = np.asarray(result)[0:ne]
+    if result.ndim == 2:
+      r = r[:,None]
+    return result * r
 
   '''
   # solve the vector heat diffusion
@@ -1449,6 +2021,12 @@ class IntrinsicMesh:
     result = scipy.sparse.linalg.spsolve(A.tocsr(),b)
     return self.CopyVectorData(result)
 
+  # create a vector heat method solver (parallel transport of vectors)
+  # the systems are factorized once and reused by all queries
+  # if t is not given, the squared average edge length is used
+  def VectorHeatSolver (self, t=None):
+    return VectorHeat(self,t)
+
 
   # solve the poisson equation, where b is the independent vector value
   # c is the boundary condition: a dictionary with key=vertex_index and value=pre-defined_value
@@ -1474,13 +2052,10 @@ class IntrinsicMesh:
       he[j] = self.next(he[j])
     return he
 
-  # transfer data
-  # apply least square for minimizing the reconstruction error on randomly generated points
-  # the function returns the solution mapped to extrinsic vertices
-  # the factor f indicates how many points will be considered in the optimization: n = f * |V| 
-  # the use_v flag indicates if the results at shared vertices should be include or
-  # if only random points will be considered
-  def data_transfer (self, solution, f=4.0, use_v=True):
+  # build the least square system that transfers vertex data to the extrinsic mesh
+  # return (mat, P): the transferred data x minimizes |mat x - P solution|
+  # (the sampling points are random, so the system is built once and reused for many solutions)
+  def transfer_system (self, f=4.0, use_v=True):
     nv = len(self.V)
     ne = len(self.HE.V)
     n = f * nv
@@ -1492,12 +2067,12 @@ class IntrinsicMesh:
       points = self.HE.generate_random_points(n)
     # build incosistent system for least square
     mat = scipy.sparse.lil_matrix((n,ne),dtype='float')
-    b = np.zeros(n)
+    P = scipy.sparse.lil_matrix((n,nv),dtype='float')
     if use_v:
       # fill vertex points in the system
       for i in range(ne):
         mat[i,i] = 1
-        b[i] = solution[i]
+        P[i,i] = 1
     else:
       i = -1
     # fill random points in the system
@@ -1514,19 +2089,41 @@ class IntrinsicMesh:
       mat[i,ve1] = uvw[1]
       mat[i,ve2] = uvw[2]
 
-      # compute numerical value on intrinsic mesh
+      # interpolate numerical value on intrinsic mesh
       h0, uvw_i = self.te_point_location(te,uvw)
       h1 = self.next(h0)
       h2 = self.next(h1)
       v0 = self.H[h0][0]
       v1 = self.H[h1][0]
       v2 = self.H[h2][0]
-      b[i] = uvw_i[0]*solution[v0] + uvw_i[1]*solution[v1] + uvw_i[2]*solution[v2] 
+      P[i,v0] += uvw_i[0]
+      P[i,v1] += uvw_i[1]
+      P[i,v2] += uvw_i[2]
+    return mat.tocsr(), P.tocsr()
 
+  # transfer data
+  # apply least square for minimizing the reconstruction error on randomly generated points
+  # the function returns the solution mapped to extrinsic vertices
+  # the factor f indicates how many points will be considered in the optimization: n = f * |V| 
+  # the use_v flag indicates if the results at shared vertices should be include or
+  # if only random points will be considered
+  def data_transfer (self, solution, f=4.0, use_v=True):
+    mat, P = self.transfer_system(f,use_v)
+    b = P @ np.asarray(solution)
     # solve the system with least square
     x = scipy.sparse.linalg.lsqr(mat,b)[0]
     return x
 
+  # return the sparse prolongation matrix (|V| x |HE.V|, csr format) that interpolates values
+  # at the extrinsic vertices to the intrinsic vertices (barycentric interpolation at their
+  # location on the extrinsic mesh); the matrix is cached while the embedding does not change
+  def ProlongationMatrix (self):
+    return self.get_embedding().prolongation()
+
+  # map values at the extrinsic vertices (|HE.V|, or |HE.V| x k for k fields) to the intrinsic vertices
+  def Prolongate (self, values):
+    return self.ProlongationMatrix() @ np.asarray(values)
+
   def find_largest_ungraded_triangle (self, min_angle):
     area_max = None
     t_max = None
@@ -1555,27 +2152,101 @@ class IntrinsicMesh:
     return t_min, t_angle_min
 
   # improve triangulation according to Chew's algorithm
-  def chew93 (self, min_angle):
+  # if batch is set, the circumcenters of bad triangles with disjoint cavities
+  # are inserted in the same round (see chew93_batch); the sequential mode is faster
+  # policy selects the Steiner point: 'circumcenter', 'offcenter' or 'sink' (see t_steiner_location)
+  # triangles are also refined if their area is larger than amax or if their edges are
+  # longer than the size field: a value, or a list per extrinsic vertex (size) or triangle (tsize)
+  # return the number of inserted vertices
+  def chew93 (self, min_angle, batch=False, policy='circumcenter', amax=None, size=None, tsize=None):
+    if batch:
+      return self.chew93_batch(min_angle,policy,amax,size,tsize)
     #n_none = 0
     v = None
-    hp = THeap(self,min_angle)
+    hp = THeap(self,min_angle,amax,size,tsize)
     n = 0
-    while True:
-      t, area, angle = hp.pop()
-      if t==None:
-        break
-      n += 1
-      if n % 1000 == 0:
-        print(">",self.get_angle_min()*180/math.pi)
-      v, tset = self.t_add_vertex(t)
-      if not v:
-        break
-      hp.update(tset)
-  
-  # add vertex at triangle circumcenter
-  # return queue of updated triangles
-  def t_add_vertex (self, t):
-    TOL = 1e-5
+    lazy = self.set_lazy(True)
+    try:
+      while True:
+        t, area, angle = hp.pop()
+        if t==None:
+          break
+        v, tset = self.t_add_vertex(t,policy,min_angle)
+        if not v:
+          continue  # Steiner point at an existing vertex: t is dropped
+        n += 1
+        if n % 1000 == 0:
+          print(">",self.get_angle_min()*180/math.pi)
+        self.t_requeue(t,policy,tset)
+        hp.update(tset)
+    finally:
+      self.set_lazy(lazy)
+    return n
+
+  # create a resumable refinement (Chew's algorithm) with limits: maximum number of vertices,
+  # time limit (in seconds) and a schedule of target minimum angles (see Refinement)
+  # call run() on the returned object; Refinement.load(mesh,filename) resumes a checkpoint
+  def refinement (self, schedule, policy='circumcenter', amax=None, size=None, tsize=None,
+                  max_vertices=None, time_limit=None):
+    return Refinement(self,schedule,policy,amax,size,tsize,max_vertices,time_limit)
+
+  # improve triangulation according to Chew's algorithm, inserting points in rounds
+  # each round collects all bad triangles (in priority order) and inserts the Steiner points
+  # whose cavities do not overlap the triangles already taken in the round (the cavities of
+  # the inserted points and the triangles created by them); a single flip pass then restores
+  # the Delaunay property
+  # cavities are computed on demand and abandoned as soon as they reach a taken triangle,
+  # so bad triangles postponed to the next round cost little; the selected points may
+  # differ from the ones of chew93, which updates the bad triangles after each insertion
+  # the cavity computations are extra work: the batch mode takes about 1.1-1.3 times the
+  # time per insertion of the sequential one (chew93), which remains the default
+  # return the number of inserted vertices
+  def chew93_batch (self, min_angle, policy='circumcenter', amax=None, size=None, tsize=None):
+    hp = THeap(self,min_angle,amax,size,tsize)
+    n = 0
+    lazy = self.set_lazy(True)
+    try:
+      while True:
+        bad = []
+        while True:
+          t, area, angle = hp.pop()
+          if t == None:
+            break
+          bad.append(t)
+        if not bad:
+          break
+        taken = set()  # triangles in the cavities of the inserted points and created by them
+        refined = []   # refined bad triangles, to queue again after the flips (see t_requeue)
+        eset = {}
+        tset = {}
+        for t in bad:
+          if t in taken:
+            tset[t] = True  # postpone to the next round
+            continue
+          h0, uvw = self.t_steiner_location(t,policy,min_angle)
+          if max(uvw) > 1-STEINER_TOL:
+            continue  # Steiner point at an existing vertex: t is dropped
+          cavity = self.p_cavity(h0,uvw,taken)
+          if cavity == None:
+            tset[t] = True  # postpone to the next round
+            continue
+          taken.update(cavity)
+          nt = len(self.T)
+          self.t_refine(h0,uvw,eset,tset)
+          taken.update(range(nt,len(self.T)))
+          refined.append(t)
+          n += 1
+        self.delaunay_flip(eset,tset)
+        for t in refined:
+          self.t_requeue(t,policy,tset)
+        hp.update(tset)
+    finally:
+      self.set_lazy(lazy)
+    return n
+
+  # locate the circumcenter of triangle t (computed from its largest angle)
+  # return the halfedge of the triangle that contains it and its baricentric coordinates
+  def t_circumcenter_location (self, t):
     h0 = self.T[t]
     h1 = self.next(h0)
     h2 = self.next(h1)
@@ -1583,10 +2254,110 @@ class IntrinsicMesh:
     imax = utl.imax(self.t_get_angles(t))
     v = self.t_flatten(hlist[imax])
     c = utl.circumcenter(v[0],v[1],v[2])
-    h0, uvw = self.point_location(c,hlist[imax],0)
+    return self.point_location(c,hlist[imax],0)
+
+  # locate the off-center of triangle t (Ungor, 2004)
+  # the point on the bisector of the shortest edge that forms, with this edge,
+  # a triangle with angle amin at the point; the circumcenter is used if it is closer to the edge
+  def t_offcenter_location (self, t, amin):
+    h0 = self.T[t]
+    h1 = self.next(h0)
+    h2 = self.next(h1)
+    hlist = [h0,h1,h2]
+    imin = utl.imin(self.t_get_angles(t))
+    hs = self.next(hlist[imin])  # shortest edge, opposite to the smallest angle
+    v = self.t_flatten(hs)
+    c = utl.circumcenter(v[0],v[1],v[2])
+    d = 0.5 * v[1][0] / math.tan(amin/2)
+    if c[1] > d:
+      c = [c[0],d]
+    return self.point_location(c,hs,0)
+
+  # find the sink of triangle t (Edelsbrunner and Guoy, 2002)
+  # walk towards the circumcenter, across the edges opposite to obtuse angles,
+  # until reaching a triangle that contains its own circumcenter (or the border); on non Delaunay
+  # meshes, the walk may go back across an edge that is not locally Delaunay: the sink is not
+  # defined and t itself is returned
+  def t_sink (self, t):
+    t0 = t
+    prev = -1
+    for i in range(len(self.T)):
+      h0 = self.T[t]
+      h1 = self.next(h0)
+      h2 = self.next(h1)
+      hlist = [h0,h1,h2]
+      a = self.t_get_angles(t)
+      imax = utl.imax(a)
+      if a[imax] <= math.pi/2:
+        break
+      m = self.mate(self.next(hlist[imax]))
+      if m == -1:
+        break
+      if self.H[m][2] == prev:
+        return t0
+      prev = t
+      t = self.H[m][2]
+    return t
+
+  # queue triangle t again after the insertion of its Steiner point, if it may remain bad:
+  # triangles modified by the insertion are already in tset; t remains unchanged only if
+  # the point was inserted elsewhere, which is expected with the sink policy (its sink is
+  # another triangle) but not with the others (the point is out of the cavity of t, and
+  # inserting it again would not change t)
+  def t_requeue (self, t, policy, tset):
+    if policy == 'sink' and t not in tset and self.t_sink(t) != t:
+      tset[t] = True
+
+  # locate the Steiner point to refine triangle t, according to the policy:
+  #  'circumcenter': circumcenter of t
+  #  'offcenter': off-center of t, for the target minimum angle amin
+  #  'sink': circumcenter of the sink of t
+  # return the halfedge of the triangle that contains it and its baricentric coordinates
+  def t_steiner_location (self, t, policy='circumcenter', amin=None):
+    if policy == 'offcenter':
+      return self.t_offcenter_location(t,amin)
+    if policy == 'sink':
+      t = self.t_sink(t)
+    return self.t_circumcenter_location(t)
+
+  # compute the Delaunay cavity of a point: the set of triangles whose circumcircle
+  # contains the point, given the halfedge of its containing triangle and baricentric coordinates
+  # if a set of taken triangles is given, return None as soon as the cavity reaches one of them
+  def p_cavity (self, h0, uvw, taken=None):
+    if taken != None and self.H[h0][2] in taken:
+      return None
+    v = self.t_flatten(h0)
+    p = utl.from_baricentric(v[0],v[1],v[2],uvw)
+    h1 = self.next(h0)
+    h2 = self.next(h1)
+    cavity = set([self.H[h0][2]])
+    # stack of cavity border halfedges with the flattened position of their vertices
+    stack = [(h0,v[0],v[1]),(h1,v[1],v[2]),(h2,v[2],v[0])]
+    while stack:
+      h, a, b = stack.pop()
+      m = self.mate(h)
+      if m == -1 or self.H[m][2] in cavity:
+        continue
+      _, c, _, _ = self.compute_flattern(b,m,math.atan2(a[1]-b[1],a[0]-b[0]),a)
+      o = utl.circumcenter(b,a,c)
+      if utl.distance(o,p) < utl.distance(o,a):
+        if taken != None and self.H[m][2] in taken:
+          return None
+        cavity.add(self.H[m][2])
+        stack.append((self.next(m),a,c))
+        stack.append((self.previous(m),c,b))
+    return cavity
+  
+  # add vertex at triangle circumcenter (or other Steiner point, see t_steiner_location)
+  # return queue of updated triangles
+  def t_add_vertex (self, t, policy='circumcenter', amin=None):
+    TOL = 1e-5
+    h0, uvw = self.t_steiner_location(t,policy,amin)
     #utl.vclamp(uvw,TOL,1-TOL)
     eset = {}  # to collect updated halfedges
     tset = {}  # to collect updated triangles 
+    if max(uvw) > 1-STEINER_TOL:
+      return None, tset  # point at an existing vertex; nothing to insert
     '''
     if min(uvw) < TOL:
       #if max(uvw) > 1-TOL:
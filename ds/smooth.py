@@ -0,0 +1,210 @@
+# smooth: vertex smoothing for intrinsic triangulations
+# Waldemar Celes
+# Tecgraf Institute of PUC-Rio
+# celes@tecgraf.puc-rio.br
+
+# This is an auxiliary class that smooths the inserted (non extrinsic) vertices of an
+# intrinsic triangulation, in array form. Each iteration computes, for a set of pairwise
+# non adjacent vertices at once, the new position in the flattened star of each vertex:
+#  'odt': area weighted average of the triangle circumcenters (as vertex_displacement)
+#  'lloyd': area weighted average of the triangle barycenters (star centroid)
+# and updates the lengths of their incident edges, unless the minimum angle of the star
+# decreases. As the vertices of a batch are not adjacent, the updates are independent.
+# The supporting information (S/A) is updated through the atomic operations
+# update_removal/update_insertion of the mesh.
+
+import math
+import numpy as np
+
+class Smoother:
+  def __init__ (self, mesh, kind='odt'):
+    self.mesh = mesh
+    self.kind = kind
+    self.rng = np.random.default_rng(0)
+
+  # convert the mesh lists to arrays and compute the angle at the origin of each halfedge
+  def arrays (self):
+    mesh = self.mesh
+    H = np.array(mesh.H,dtype='int64').reshape(-1,4)
+    E = np.array(mesh.E,dtype='int64').reshape(-1,2)
+    L = np.array(mesh.L,dtype='float64')
+    ids = np.arange(len(H))
+    e = E[H[:,1]]
+    mate = np.where(e[:,0] == ids, e[:,1], e[:,0])
+    n = H[:,3]
+    l0 = L[H[:,1]]
+    l1 = L[H[n,1]]
+    l2 = L[H[n[n],1]]
+    angle = np.arccos(np.clip((l0*l0+l2*l2-l1*l1)/(2*l0*l2),-1,1))
+    return H, mate, L, angle
+
+  # return the inserted vertices that can be moved: not on border and without self loops
+  def candidates (self, H, mate):
+    nv = len(self.mesh.V)
+    ne = len(self.mesh.HE.V)
+    border = np.zeros(nv,dtype=bool)
+    b = np.nonzero(mate == -1)[0]
+    border[H[b,0]] = True
+    border[H[H[b,3],0]] = True
+    loop = np.zeros(nv,dtype=bool)
+    s = np.nonzero(H[:,0] == H[H[:,3],0])[0]
+    loop[H[s,0]] = True
+    v = np.arange(ne,nv)
+    return v[~border[v] & ~loop[v]], border
+
+  # split the vertices in sets of pairwise non adjacent vertices (Luby's method)
+  def batches (self, vs, H):
+    mark = np.zeros(len(self.mesh.V),dtype=bool)
+    mark[vs] = True
+    # edges between candidate vertices
+    a = H[:,0]
+    b = H[H[:,3],0]
+    keep = mark[a] & mark[b]
+    a = a[keep]
+    b = b[keep]
+    batches = []
+    rest = vs
+    while len(rest):
+      prio = np.full(len(self.mesh.V),-1.0)
+      prio[rest] = self.rng.random(len(rest))
+      nmax = np.full(len(self.mesh.V),-1.0)
+      np.maximum.at(nmax,a,prio[b])
+      sel = rest[prio[rest] > nmax[rest]]
+      batches.append(sel)
+      # remove the selected vertices and their neighbors
+      prio[sel] = 2.0
+      nmax = np.full(len(self.mesh.V),-1.0)
+      np.maximum.at(nmax,a,prio[b])
+      rest = rest[(prio[rest] < 2.0) & (nmax[rest] < 2.0)]
+      mark[:] = False
+      mark[rest] = True
+      keep = mark[a] & mark[b]
+      a = a[keep]
+      b = b[keep]
+    return batches
+
+  # walk the stars of the given vertices simultaneously
+  # return, for all incident halfedges, the vertex position in vs, the halfedge and its polar angle
+  def stars (self, vs, H, mate, angle):
+    prev = H[H[:,3],3]
+    start = np.array(self.mesh.V,dtype='int64')[vs]
+    k = np.arange(len(vs))
+    h = start
+    acc = np.zeros(len(vs))
+    K = []
+    S = []
+    P = []
+    while len(h):
+      K.append(k)
+      S.append(h)
+      P.append(acc)
+      acc = acc + angle[h]
+      h = mate[prev[h]]
+      keep = h != start
+      h = h[keep]
+      k = k[keep]
+      acc = acc[keep]
+      start = start[keep]
+    return np.concatenate(K), np.concatenate(S), np.concatenate(P)
+
+  # compute the minimum angle of triangles given their edge lengths
+  def min_angle (self, l0, l1, l2):
+    a0 = np.arccos(np.clip((l0*l0+l2*l2-l1*l1)/(2*l0*l2),-1,1))
+    a1 = np.arccos(np.clip((l0*l0+l1*l1-l2*l2)/(2*l0*l1),-1,1))
+    return np.minimum(np.minimum(a0,a1),math.pi-a0-a1)
+
+  # compute the new positions of the vertices and the new lengths of the incident edges
+  # return the moved vertices (position in vs), the incident halfedges (k, h),
+  # the new edge lengths and the displacements
+  def positions (self, vs, H, mate, L, angle, border):
+    k, h, phi = self.stars(vs,H,mate,angle)
+    prev = H[H[:,3],3]
+    # flattened triangle (0, p, q) of each incident halfedge
+    lp = L[H[h,1]]
+    lq = L[H[prev[h],1]]
+    p = np.stack((lp*np.cos(phi),lp*np.sin(phi)),axis=1)
+    q = np.stack((lq*np.cos(phi+angle[h]),lq*np.sin(phi+angle[h])),axis=1)
+    area = 0.5 * (p[:,0]*q[:,1] - p[:,1]*q[:,0])
+    bary = (p + q) / 3
+    if self.kind == 'lloyd':
+      c = bary
+    else:
+      # circumcenter, or barycenter for triangles touching the border (as t_center)
+      d = 2 * (p[:,0]*q[:,1] - p[:,1]*q[:,0])
+      pp = lp * lp
+      qq = lq * lq
+      c = np.stack(((q[:,1]*pp - p[:,1]*qq)/d,(p[:,0]*qq - q[:,0]*pp)/d),axis=1)
+      tb = border[H[H[h,3],0]] | border[H[prev[h],0]]
+      c[tb] = bary[tb]
+    n = len(vs)
+    atotal = np.bincount(k,weights=area,minlength=n)
+    v0 = np.stack((np.bincount(k,weights=c[:,0]*area,minlength=n),
+                   np.bincount(k,weights=c[:,1]*area,minlength=n)),axis=1) / atotal[:,None]
+    # check consistency: no triangle flip
+    pq = np.sqrt(np.sum((p-q)**2,axis=1))
+    o = (p[:,0]-v0[k,0])*(q[:,1]-v0[k,1]) - (p[:,1]-v0[k,1])*(q[:,0]-v0[k,0])
+    bad = np.zeros(n,dtype=bool)
+    bad[k[o/2/pq <= 1e-5]] = True
+    # keep the vertex in place if the minimum angle of its star decreases
+    lnew = np.sqrt(np.sum((p - v0[k])**2,axis=1))
+    lnext = np.sqrt(np.sum((q - v0[k])**2,axis=1))
+    aold = np.full(n,math.pi)
+    anew = np.full(n,math.pi)
+    np.minimum.at(aold,k,self.min_angle(lp,pq,lq))
+    np.minimum.at(anew,k,self.min_angle(lnew,pq,lnext))
+    bad |= anew < aold
+    ok = ~bad[k]
+    disp = np.sqrt(np.sum(v0**2,axis=1))
+    return ~bad, k[ok], h[ok], lnew[ok], disp
+
+  # move one batch of non adjacent vertices
+  # return the number of moved vertices and the maximum displacement
+  def move (self, vs):
+    mesh = self.mesh
+    H, mate, L, angle = self.arrays()
+    _, border = self.candidates(H,mate)
+    moved, k, h, lnew, disp = self.positions(vs,H,mate,L,angle,border)
+    if not len(h):
+      return 0, 0.0
+    m = mate[h]
+    ext = m[H[m,0] < len(mesh.HE.V)]  # incident halfedges with supporting information
+    # simulate removing halfedges to update sign
+    for hi in ext:
+      mesh.update_removal(int(hi))
+    # adjust edge lengths
+    for e, l in zip(H[h,1].tolist(),lnew.tolist()):
+      mesh.L[e] = l
+    # simulate inserting halfedges to update sign
+    for hi in ext:
+      mesh.update_insertion(int(hi))
+    vlist = np.unique(np.concatenate((vs[moved],H[m,0]))).tolist()
+    mesh.v_modified(vlist)
+    return int(np.count_nonzero(moved)), float(np.max(disp[moved])) if moved.any() else 0.0
+
+  # run smoothing iterations, until the maximum displacement (relative to the average
+  # edge length) is less than tol; if delaunay is set, the Delaunay property is restored
+  # after each iteration
+  # return the statistics of each iteration (moved vertices, max displacement, flips,
+  # min angle) and whether the displacement reached tol within niter iterations
+  def run (self, niter=10, tol=1e-3, delaunay=True):
+    mesh = self.mesh
+    stats = []
+    converged = False
+    for it in range(niter):
+      H, mate, L, angle = self.arrays()
+      vs, _ = self.candidates(H,mate)
+      lavg = np.mean(L)
+      moved = 0
+      dmax = 0.0
+      for batch in self.batches(vs,H):
+        n, d = self.move(batch)
+        moved += n
+        dmax = max(dmax,d)
+      flips = mesh.delaunay() if delaunay else 0
+      _, _, _, angle = self.arrays()
+      stats.append({'iteration': it, 'moved': moved, 'displacement': float(dmax / lavg),
+                    'flips': int(flips), 'angle_min': float(np.min(angle))})
+      if dmax / lavg < tol:
+        converged = True
+        break
+    return stats, converged
@@ -0,0 +1,118 @@
+# spectrum: spectral decomposition of the intrinsic Laplacian
+# Waldemar Celes
+# Tecgraf Institute of PUC-Rio
+# celes@tecgraf.puc-rio.br
+
+# This is an auxiliary class that computes and caches the smallest generalized eigenpairs
+# of the intrinsic Laplacian: -K phi = lambda M phi, with K the cotangent stiffness matrix
+# and M the lumped mass matrix (eigenvectors are M-orthonormal).
+# The cache is keyed by the versions of the live matrices of the mesh: it is discarded
+# when the mesh is modified. Requesting more eigenpairs extends the cached basis,
+# computing only the new ones (the known eigenvectors are deflated).
+# Heat diffusion and heat kernel signatures at arbitrary times are evaluated from the
+# cached spectrum, without solving any linear system.
+
+import numpy as np
+import scipy
+
+class Spectrum:
+  def __init__ (self, mesh, method='shift-invert', sigma=None):
+    self.mesh = mesh
+    self.method = method    # 'shift-invert' (eigsh) or 'lobpcg'
+    self.sigma = sigma      # shift (negative, as -K is singular); if None, relative to trace(-K)/trace(M)
+    self.versions = None
+    self.reset()
+
+  # discard the cached eigenbasis
+  def reset (self):
+    self.vals = np.zeros(0)
+    self.vecs = None
+    self.shift = None
+    self.solver = None  # factorization of (-K - shift M), also used as lobpcg preconditioner
+
+  # check the mesh version, discarding the cache if the mesh was modified
+  def check (self):
+    mesh = self.mesh
+    self.A = -mesh.StiffnessMatrix()
+    self.B = mesh.MassMatrix()
+    versions = (mesh.get_stiffness().version,mesh.get_mass().version)
+    if versions != self.versions:
+      self.reset()
+      self.versions = versions
+
+  # return the number of cached eigenpairs
+  def size (self):
+    return len(self.vals)
+
+  # return the k smallest eigenpairs: eigenvalues (k) and eigenvectors (n x k)
+  def eigenpairs (self, k):
+    self.check()
+    n = self.A.shape[0]
+    k = min(k,n-1)
+    if k > self.size():
+      self.extend(k)
+    return self.vals[0:k], self.vecs[:,0:k]
+
+  # extend the cached eigenbasis up to k eigenpairs
+  def extend (self, k):
+    n = self.A.shape[0]
+    nc = self.size()
+    if self.solver == None:
+      self.shift = self.sigma
+      if self.shift == None:
+        self.shift = -1e-3 * self.A.diagonal().sum() / self.B.diagonal().sum()
+      self.solver = scipy.sparse.linalg.splu((self.A - self.shift * self.B).tocsc())
+    Y = self.vecs
+    if self.method == 'lobpcg':
+      P = scipy.sparse.linalg.LinearOperator((n,n),matvec=self.solver.solve,matmat=self.solver.solve)
+      X = np.random.default_rng(0).standard_normal((n,k-nc))
+      vals, vecs = scipy.sparse.linalg.lobpcg(self.A,X,B=self.B,M=P,Y=Y,tol=1e-8,maxiter=500,largest=False)
+    else:
+      B = self.B
+      # deflate the known eigenvectors, if any (M-orthogonal projection)
+      def deflated_solve (x):
+        y = self.solver.solve(x)
+        return y - Y @ (Y.T @ (B @ y))
+      solve = self.solver.solve if nc == 0 else deflated_solve
+      OPinv = scipy.sparse.linalg.LinearOperator((n,n),matvec=solve)
+      vals, vecs = scipy.sparse.linalg.eigsh(self.A,k-nc,B,sigma=self.shift,which='LM',OPinv=OPinv)
+    order = np.argsort(vals)
+    vals = vals[order]
+    vecs = vecs[:,order]
+    # normalize w.r.t. the mass matrix
+    vecs = vecs / np.sqrt(np.sum(vecs * (self.B @ vecs),axis=0))
+    if nc == 0:
+      self.vals = vals
+      self.vecs = vecs
+    else:
+      self.vals = np.concatenate((self.vals,vals))
+      self.vecs = np.hstack((Y,vecs))
+      order = np.argsort(self.vals,kind='stable')
+      self.vals = self.vals[order]
+      self.vecs = self.vecs[:,order]
+
+  # evaluate heat diffusion from the k smallest eigenpairs
+  # u0 is an array of initial temperatures or a dictionary (v, T)
+  # t is a time value or a list of time values
+  # return an array of temperatures: (n) or (n x len(t))
+  def heat (self, u0, t, k=100):
+    vals, vecs = self.eigenpairs(k)
+    n = vecs.shape[0]
+    if isinstance(u0,dict):
+      b = np.zeros(n)
+      for v, T in u0.items():
+        b[v] = T
+      u0 = b
+    c = vecs.T @ (self.B @ np.asarray(u0))
+    decay = np.exp(-np.outer(vals,np.atleast_1d(t)))
+    u = vecs @ (c[:,None] * decay)
+    return u if np.ndim(t) else u[:,0]
+
+  # evaluate the heat kernel signature from the k smallest eigenpairs
+  # t is a time value or a list of time values
+  # return an array: (n) or (n x len(t))
+  def signature (self, t, k=100):
+    vals, vecs = self.eigenpairs(k)
+    decay = np.exp(-np.outer(vals,np.atleast_1d(t)))
+    hks = (vecs * vecs) @ decay
+    return hks if np.ndim(t) else hks[:,0]
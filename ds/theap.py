@@ -4,26 +4,96 @@
 # celes@tecgraf.puc-rio.br
 
 # This is an auxiliary class that implements a simple triangle heap to support greedy algorithms
+# A triangle is inserted if its min angle is less than the limit or, optionally, if it is
+# larger than a maximum area or than a size field (maximum edge length), evaluated from edge lengths.
+# The size field can be given per extrinsic vertex or per extrinsic triangle (converted to
+# vertices by taking the minimum of the incident triangles); the size at inserted vertices
+# is interpolated as the average of their neighbors.
 
 import heapq
 import math
+import numpy as np
 
 class THeap:
-  def __init__ (self, mesh, amin):
+  # state is an optional (heap, ts, size) tuple, as returned by state() but with the size field
+  # as a list (or None), to restore a heap
+  def __init__ (self, mesh, amin, amax=None, size=None, tsize=None, state=None):
     self.amin = amin
+    self.amax = amax                # maximum triangle area (optional)
     self.mesh = mesh
+    self.size = None                # maximum edge length at intrinsic vertices (optional)
+    if state != None:
+      heap, ts, size = state
+      self.heap = [(a,b,int(t),c,int(k)) for a, b, t, c, k in heap.tolist()]
+      heapq.heapify(self.heap)
+      self.ts = ts.tolist()
+      self.size = size
+      return
+    if tsize != None:
+      size = self.tsize_to_vsize(tsize)
+    if size != None:
+      if isinstance(size,(int,float)):
+        size = [size] * len(mesh.HE.V)
+      self.size = list(size)
+      self.update_size()
     self.heap = []                  # priority list sorted by area (decreasing order)
-    self.ts = [0] * len(mesh.T)     # triangle timestamp table 
+    self.ts = [0] * len(mesh.T)     # triangle timestamp table
     for t in range(len(mesh.T)):
       self.insert_if(t)
 
+  # return the heap state as arrays: heap entries (n x 5), triangle timestamps and size field
+  def state (self):
+    heap = np.array(self.heap,dtype='float64').reshape(-1,5)
+    ts = np.array(self.ts,dtype='int64')
+    size = np.array(self.size,dtype='float64') if self.size != None else None
+    return heap, ts, size
+
+  # convert a size field per extrinsic triangle to a size field per extrinsic vertex
+  def tsize_to_vsize (self, tsize):
+    HE = self.mesh.HE
+    size = [math.inf] * len(HE.V)
+    for te, h0 in enumerate(HE.T):
+      h = h0
+      while True:
+        v = HE.H[h][0]
+        size[v] = min(size[v],tsize[te])
+        h = HE.next(h)
+        if h == h0:
+          break
+    return size
+
+  # extend the size field to the inserted vertices
+  def update_size (self):
+    mesh = self.mesh
+    for v in range(len(self.size),len(mesh.V)):
+      s = []
+      for h in mesh.adj_vh(v):
+        vi = mesh.H[mesh.next(h)][0]
+        if vi < len(self.size):
+          s.append(self.size[vi])
+      self.size.append(sum(s)/len(s) if s else math.inf)
+
+  # check if the triangle satisfies the area and size criteria
+  def t_fit (self, t, area):
+    if self.amax != None and area > self.amax:
+      return False
+    if self.size != None:
+      mesh = self.mesh
+      lmax = max(mesh.t_get_lens(t))
+      smin = min(self.size[v] for v in mesh.t_get_inc(t))
+      if lmax > smin:
+        return False
+    return True
+
   # update heap datastructure for the triangle in the set
   def update (self, tset):
     self.ts += [0] * (len(self.mesh.T)-len(self.ts))
+    if self.size != None:
+      self.update_size()
     while tset:
       t, _ = tset.popitem()
       self.insert_if(t)
-  
+
   # pop the triangle in heap with largest area
   # return triangle id, area, and angle
   def pop (self):
@@ -34,6 +104,7 @@ class THeap:
     return None, None, None
 
   # insert a triangle in the heap if its min angle is less than the limit
+  # or if it does not satisfy the area and size criteria
   def insert_if (self, t):
     if not self.mesh.t_narrow(t):
       angle = min(self.mesh.t_get_angles(t))
@@ -41,4 +112,7 @@ class THeap:
       if angle < self.amin:
         area = self.mesh.h_area(self.mesh.T[t])
         heapq.heappush(self.heap,(angle,-area,t,angle,self.ts[t]))
-  
\ No newline at end of file
+      elif self.amax != None or self.size != None:
+        area = self.mesh.h_area(self.mesh.T[t])
+        if not self.t_fit(t,area):
+          heapq.heappush(self.heap,(angle,-area,t,angle,self.ts[t]))
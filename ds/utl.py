@@ -4,6 +4,10 @@
 # celes@tecgraf.puc-rio.br
 
 import math
+import numpy as np
+from fractions import Fraction
+
+EPS = 2.0**-53  # unit roundoff
 
 def add (a, b):
   c = a.copy()
@@ -86,6 +90,90 @@ def orient (a, b, c):
   return ((a[0]-c[0])*(b[1]-c[1])-(a[1]-c[1])*(b[0]-c[0]))
   return (b[0]*c[1] + a[0]*b[1] + a[1]*c[0]) - (a[1]*b[0] + b[1]*c[0] + a[0]*c[1])
 
+# return the orientation of the three given points, as orient, with a robust sign:
+# a floating point filter decides the sign; if it is ambiguous, it is evaluated exactly
+def orient2d (a, b, c):
+  detleft = (a[0]-c[0])*(b[1]-c[1])
+  detright = (a[1]-c[1])*(b[0]-c[0])
+  det = detleft - detright
+  if abs(det) > (3 + 16*EPS) * EPS * (abs(detleft) + abs(detright)):
+    return det
+  a = [Fraction(x) for x in a[0:2]]
+  b = [Fraction(x) for x in b[0:2]]
+  c = [Fraction(x) for x in c[0:2]]
+  det = (a[0]-c[0])*(b[1]-c[1]) - (a[1]-c[1])*(b[0]-c[0])
+  return (det > 0) - (det < 0)
+
+# batch version of orient2d: a, b, c are arrays of points (n x 2)
+# return an array of values with the same signs as orient2d
+def orient2d_batch (a, b, c):
+  a = np.asarray(a,dtype='float64')
+  b = np.asarray(b,dtype='float64')
+  c = np.asarray(c,dtype='float64')
+  detleft = (a[:,0]-c[:,0])*(b[:,1]-c[:,1])
+  detright = (a[:,1]-c[:,1])*(b[:,0]-c[:,0])
+  det = detleft - detright
+  for i in np.nonzero(np.abs(det) <= (3 + 16*EPS) * EPS * (np.abs(detleft) + np.abs(detright)))[0]:
+    det[i] = orient2d(a[i].tolist(),b[i].tolist(),c[i].tolist())
+  return det
+
+# return the incircle test of point d w.r.t. the circle through a, b, c (ccw):
+# positive if d is inside, negative if it is outside, and zero if the points are cocircular
+# a floating point filter decides the sign; if it is ambiguous, it is evaluated exactly
+def incircle (a, b, c, d):
+  adx = a[0] - d[0]
+  ady = a[1] - d[1]
+  bdx = b[0] - d[0]
+  bdy = b[1] - d[1]
+  cdx = c[0] - d[0]
+  cdy = c[1] - d[1]
+  alift = adx*adx + ady*ady
+  blift = bdx*bdx + bdy*bdy
+  clift = cdx*cdx + cdy*cdy
+  det = (alift * (bdx*cdy - bdy*cdx) +
+         blift * (cdx*ady - cdy*adx) +
+         clift * (adx*bdy - ady*bdx))
+  permanent = (alift * (abs(bdx*cdy) + abs(bdy*cdx)) +
+               blift * (abs(cdx*ady) + abs(cdy*adx)) +
+               clift * (abs(adx*bdy) + abs(ady*bdx)))
+  if abs(det) > (10 + 96*EPS) * EPS * permanent:
+    return det
+  # exact evaluation
+  a = [Fraction(x) for x in a[0:2]]
+  b = [Fraction(x) for x in b[0:2]]
+  c = [Fraction(x) for x in c[0:2]]
+  d = [Fraction(x) for x in d[0:2]]
+  adx, ady = a[0] - d[0], a[1] - d[1]
+  bdx, bdy = b[0] - d[0], b[1] - d[1]
+  cdx, cdy = c[0] - d[0], c[1] - d[1]
+  det = ((adx*adx + ady*ady) * (bdx*cdy - bdy*cdx) +
+         (bdx*bdx + bdy*bdy) * (cdx*ady - cdy*adx) +
+         (cdx*cdx + cdy*cdy) * (adx*bdy - ady*bdx))
+  return (det > 0) - (det < 0)
+
+# batch version of incircle: a, b, c, d are arrays of points (n x 2)
+# return an array of values with the same signs as incircle
+def incircle_batch (a, b, c, d):
+  a = np.asarray(a,dtype='float64')
+  b = np.asarray(b,dtype='float64')
+  c = np.asarray(c,dtype='float64')
+  d = np.asarray(d,dtype='float64')
+  ad = a[:,0:2] - d[:,0:2]
+  bd = b[:,0:2] - d[:,0:2]
+  cd = c[:,0:2] - d[:,0:2]
+  alift = np.sum(ad*ad,axis=1)
+  blift = np.sum(bd*bd,axis=1)
+  clift = np.sum(cd*cd,axis=1)
+  bc = (bd[:,0]*cd[:,1], bd[:,1]*cd[:,0])
+  ca = (cd[:,0]*ad[:,1], cd[:,1]*ad[:,0])
+  ab = (ad[:,0]*bd[:,1], ad[:,1]*bd[:,0])
+  det = alift*(bc[0]-bc[1]) + blift*(ca[0]-ca[1]) + clift*(ab[0]-ab[1])
+  permanent = (alift*(np.abs(bc[0])+np.abs(bc[1])) + blift*(np.abs(ca[0])+np.abs(ca[1])) +
+               clift*(np.abs(ab[0])+np.abs(ab[1])))
+  for i in np.nonzero(np.abs(det) <= (10 + 96*EPS) * EPS * permanent)[0]:
+    det[i] = incircle(a[i].tolist(),b[i].tolist(),c[i].tolist(),d[i].tolist())
+  return det
+
 # return the distance from an edge (a,b) to a point c
 def edge_point_distance (a, b, c):
   return orient(a,b,c)/2/distance(a,b)
@@ -103,6 +191,16 @@ def crossing (v0, v1, p, o=[0,0]):
   u1 = ccw(v0,v1,p)
   return ((t0 and not t1) or (t1 and not t0)) and ((u0 and not u1) or (u1 and not u0))
 
+# return how well the segment q-p crosses the edge a-b: the minimum distance of the crossing
+# point to the edge ends, relative to the edge (-inf if the line does not cross the edge)
+def crossing_margin (a, b, q, p):
+  o0 = orient(q,p,a)
+  o1 = orient(q,p,b)
+  if o0 == o1:
+    return -math.inf
+  w = o0 / (o0 - o1)
+  return min(w,1-w)
+
 # clamp values
 def vclamp (v, xmin, xmax):
   for i in range(len(v)):
@@ -212,6 +310,134 @@ def imax (v):
       imax = i
   return imax
 
+# return index of minimum element in list
+def imin (v):
+  xmin = v[0]
+  imin = 0
+  for i in range(1,len(v)):
+    if v[i] < xmin:
+      xmin = v[i]
+      imin = i
+  return imin
+
+# return the minimum angle of a triangle given its vertices
+def tri_min_angle (a, b, c):
+  l0 = distance(a,b)
+  l1 = distance(b,c)
+  l2 = distance(c,a)
+  a0 = math.acos(clamp((l0*l0+l2*l2-l1*l1)/(2*l0*l2),-1,1))
+  a1 = math.acos(clamp((l0*l0+l1*l1-l2*l2)/(2*l0*l1),-1,1))
+  return min(a0,a1,math.pi-a0-a1)
+
+# return the largest minimum angle among the triangulations of a simple polygon
+# (given in ccw order), using dynamic programming; return -1 if there is no valid triangulation
+def polygon_maxmin_angle (p):
+  n = len(p)
+  best = [[-1]*n for i in range(n)]
+  for i in range(n-1):
+    best[i][i+1] = math.pi
+  for d in range(2,n):
+    for i in range(n-d):
+      j = i + d
+      for m in range(i+1,j):
+        if best[i][m] < 0 or best[m][j] < 0 or orient(p[i],p[m],p[j]) <= 0:
+          continue
+        if any(in_triangle([p[i],p[m],p[j]],p[k]) for k in range(n) if k not in (i,m,j)):
+          continue
+        a = min(best[i][m],best[m][j],tri_min_angle(p[i],p[m],p[j]))
+        if a > best[i][j]:
+          best[i][j] = a
+  return best[0][n-1]
+
+# 16 times the squared area of a triangle given its edge lengths (Heron's formula)
+def heron16 (a, b, c):
+  return (a+b+c)*(-a+b+c)*(a-b+c)*(a+b-c)
+
+# relative error bound of heron16 (inf for degenerate triangles)
+def heron16_err (a, b, c):
+  p = a + b + c
+  f = (-a+b+c, a-b+c, a+b-c)
+  if min(f) <= 0:
+    return math.inf
+  return 4 * EPS * p * (1/p + 1/f[0] + 1/f[1] + 1/f[2])
+
+# exact sign of x + y*sqrt(q), with x, y and q rational (q >= 0)
+def sign_root (x, y, q):
+  sx = (x > 0) - (x < 0)
+  sy = (y > 0) - (y < 0) if q > 0 else 0
+  if sy == 0 or sx == sy:
+    return sx
+  if sx == 0:
+    return sy
+  d = x*x - y*y*q
+  return sx if d > 0 else (sy if d < 0 else 0)
+
+# exact sign of x1*sqrt(q1) + x2*sqrt(q2) + x3, with rational values (q1, q2 >= 0)
+def sign_roots (x1, q1, x2, q2, x3=0):
+  if q1 == 0:
+    s = (x2 > 0) - (x2 < 0) if q2 > 0 else 0
+  else:
+    s = sign_root(x1*q1,x2,q1*q2)
+  t = (x3 > 0) - (x3 < 0)
+  if t == 0 or s == t:
+    return s
+  if s == 0:
+    return t
+  # compare the squares of both parts
+  d = sign_root(x1*x1*q1 + x2*x2*q2 - x3*x3,2*x1*x2,q1*q2)
+  return s if d > 0 else (t if d < 0 else 0)
+
+# Delaunay test of an edge given the edge lengths of its two triangles, without trigonometry:
+# e is the edge length, (a,b) and (c,d) the other edge lengths of each triangle
+# the edge is legal if the sum of the opposite angles is not larger than pi + delta:
+#   sin(alpha+beta) = (u*r2 + v*r1) / (4abcd) >= -sin(delta), and cos(alpha+beta) < 0,
+# with u = a^2+b^2-e^2, v = c^2+d^2-e^2 and r = 4*area (square root of heron16)
+# a floating point filter decides the test; if it is ambiguous, it is evaluated exactly
+# return whether the edge is legal and whether the exact evaluation was needed
+def delaunay_len (e, a, b, c, d, delta=1e-5):
+  u = a*a + b*b - e*e
+  v = c*c + d*d - e*e
+  h1 = heron16(e,a,b)
+  h2 = heron16(e,c,d)
+  k1 = heron16_err(e,a,b)
+  k2 = heron16_err(e,c,d)
+  if h1 > 0 and h2 > 0 and k1 < 1 and k2 < 1:
+    r1 = math.sqrt(h1)
+    r2 = math.sqrt(h2)
+    eu = 4 * EPS * (a*a + b*b + e*e)
+    ev = 4 * EPS * (c*c + d*d + e*e)
+    s = u*r2 + v*r1
+    tol = 4*a*b*c*d * math.sin(delta)
+    err = 2 * (8*EPS*(abs(u)*r2 + abs(v)*r1 + tol) + eu*r2 + ev*r1 + abs(u)*r2*k2 + abs(v)*r1*k1)
+    if s > err:
+      return True, False
+    if s + tol < -err:
+      return False, False
+    if s + tol > err:
+      # angle sum not larger than pi + delta, or close to 2 pi (cos(alpha+beta) > 0)
+      w = u*v - r1*r2
+      errw = 2 * (8*EPS*(abs(u*v) + r1*r2) + eu*abs(v) + ev*abs(u) + r1*r2*(k1 + k2))
+      if w < -errw:
+        return True, False
+      if w > errw and s < -err:
+        return False, False
+  # exact evaluation
+  tol = 4 * Fraction(a)*Fraction(b)*Fraction(c)*Fraction(d) * Fraction(math.sin(delta))
+  e = Fraction(e)**2
+  a = Fraction(a)**2
+  b = Fraction(b)**2
+  c = Fraction(c)**2
+  d = Fraction(d)**2
+  u = a + b - e
+  v = c + d - e
+  h1 = 2*(e*a + a*b + b*e) - (e*e + a*a + b*b)
+  h2 = 2*(e*c + c*d + d*e) - (e*e + c*c + d*d)
+  if h1 <= 0 or h2 <= 0:
+    return u + v >= 0, True   # degenerate triangle
+  if sign_roots(u,h2,v,h1) >= 0:
+    return True, True
+  return sign_roots(u,h2,v,h1,tol) >= 0 and sign_root(u*v,-1,h1*h2) < 0, True
+
 # compute the barycentric coordinates of a given point
 def barycentric (a, b, c, p):
   A = area(a,b,c)
@@ -0,0 +1,74 @@
+# vheat: vector heat method for intrinsic triangulations
+# Waldemar Celes
+# Tecgraf Institute of PUC-Rio
+# celes@tecgraf.puc-rio.br
+
+# This is an auxiliary class that implements the vector heat method (Sharp et al. 2019)
+# on top of the live matrices of the extended intrinsic mesh (she3).
+# The connection diffusion system and the scalar diffusion system (used for both the
+# magnitude and the indicator functions) are factorized once and reused by all queries,
+# as long as the mesh is not modified.
+# Vectors are complex numbers expressed in the tangent frame of the intrinsic vertices.
+
+import numpy as np
+import scipy
+
+EPS = 1e-12  # indicator values below EPS times the maximum are not reached by the diffusion
+
+class VectorHeat:
+  def __init__ (self, mesh, t=None):
+    self.mesh = mesh
+    if t == None:
+      t = mesh.l_average()**2   # time step proportional to the squared mean edge length
+    self.t = t
+    self.versions = None
+    self.factorize()
+
+  # factorize the diffusion systems if the mesh matrices were modified
+  def factorize (self):
+    mesh = self.mesh
+    K = mesh.StiffnessMatrix()
+    M = mesh.MassMatrix()
+    KC = mesh.ConnectionLaplacianMatrix()
+    versions = (mesh.get_stiffness().version,mesh.get_mass().version,mesh.get_connection().version)
+    if versions == self.versions:
+      return False
+    self.vsolver = scipy.sparse.linalg.splu((M - self.t * KC).tocsc())
+    self.ssolver = scipy.sparse.linalg.splu((M - self.t * K).tocsc())
+    self.versions = versions
+    return True
+
+  # solve the vector heat method for a set of queries
+  # sources is a dictionary (v, vector) or a list of such dictionaries
+  # (each dictionary is a query whose sources are diffused together)
+  # return the normalized transported vectors at intrinsic and extrinsic vertices:
+  # two complex arrays, (n) and (ne), or (n x k) and (ne x k) for a list of k queries
+  def solve (self, sources):
+    single = isinstance(sources,dict)
+    if single:
+      sources = [sources]
+    self.factorize()
+    n = len(self.mesh.V)
+    k = len(sources)
+    Y0 = np.zeros((n,k),dtype='complex128')
+    U0 = np.zeros((n,2*k))   # magnitude and indicator right-hand sides
+    for j, query in enumerate(sources):
+      for v, X in query.items():
+        Y0[v,j] = X
+        U0[v,j] = abs(X)
+        U0[v,k+j] = 1
+    Y = self.vsolver.solve(Y0)
+    U = self.ssolver.solve(U0)
+    u = U[:,0:k]
+    phi = U[:,k:]
+    # normalize the transported direction and scale it by the interpolated magnitude
+    # vertices not reached by the diffusion (e.g. other components, underflow) get zero vectors
+    mod = np.abs(Y)
+    mod[mod == 0] = 1
+    reached = phi > EPS * np.max(phi,axis=0)
+    ratio = np.where(reached,u / np.where(reached,phi,1),0)
+    X = Y / mod * ratio
+    Xe = self.mesh.CopyVectorData(X)
+    if single:
+      return X[:,0], Xe[:,0]
+    return X, Xe
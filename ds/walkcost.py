@@ -0,0 +1,122 @@
+# walkcost: walk cost analysis of the intrinsic rendering shaders
+# Waldemar Celes
+# Tecgraf Institute of PUC-Rio
+# celes@tecgraf.puc-rio.br
+
+# This is an auxiliary module that reproduces, on the CPU, the point location walk of the
+# intrinsic fragment shaders (find_triangle in fragment_intrinsic.glsl and
+# fragment_intrinsic3.glsl): for each fragment, the walk starts at the supporting halfedge of
+# the extrinsic triangle and visits at most IMAX intrinsic triangles.
+# The walk is run on a regular sample grid of each extrinsic triangle (n*n points at the
+# centroids of its n-subdivision), giving per extrinsic triangle the mean and maximum number of
+# visited triangles and the number of samples that exceed IMAX (rendered with the fallback
+# color by the shader). The number of visited triangles drives the cost of the fragments, so
+# these statistics predict the rendering cost and catch meshes that overflow IMAX.
+# The walk is computed in double precision; the shader uses single precision, so samples
+# very close to intrinsic edges may take a different path.
+
+import math
+import numpy as np
+from . import utl
+
+IMAX = 200  # maximum number of visited triangles (as in the shaders)
+
+# walk from the supporting halfedge of an extrinsic triangle to the intrinsic triangle that
+# contains the point p (in the 2d frame of te_flatten), as find_triangle in the shaders
+# return the intrinsic triangle (-1 if IMAX is exceeded) and the number of visited triangles
+def find_triangle (mesh, te, p, imax=IMAX):
+  h0, phi0 = mesh.te_support(te)
+  l0 = mesh.L[mesh.H[h0][1]]
+  v0 = [0, 0]
+  v1 = [l0*math.cos(phi0), l0*math.sin(phi0)]
+  for niter in range(imax):
+    # compute v2
+    t = mesh.H[h0][2]
+    h1 = mesh.next(h0)
+    h2 = mesh.next(h1)
+    l1 = mesh.L[mesh.H[h1][1]]
+    l2 = mesh.L[mesh.H[h2][1]]
+    alpha = math.acos(clamp((l0*l0+l1*l1-l2*l2)/(2*l0*l1)))
+    phi1 = phi0 + math.pi - alpha
+    v2 = [v1[0] + l1*math.cos(phi1), v1[1] + l1*math.sin(phi1)]
+    # check which triangle edge crosses line segment 0-p
+    out_v1v2 = not utl.ccw(v1,v2,p)
+    if out_v1v2 and utl.crossing(v1,v2,p):
+      m1 = mesh.mate(h1)
+      if m1 != -1:
+        v0 = v2
+        l0 = l1
+        h0 = m1
+        phi0 = phi1 + math.pi
+        continue
+    elif out_v1v2 or not utl.ccw(v2,v0,p):
+      m2 = mesh.mate(h2)
+      if m2 != -1:
+        beta = math.acos(clamp((l0*l0+l2*l2-l1*l1)/(2*l0*l2)))
+        v1 = v2
+        l0 = l2
+        h0 = m2
+        phi0 = phi0 + beta
+        continue
+    return t, niter + 1
+  return -1, imax
+
+# return the sample points of an extrinsic triangle, in the 2d frame of te_flatten: the
+# centroids of the n*n triangles of its regular n-subdivision
+def samples (ce, n):
+  pts = []
+  for i in range(n):
+    for j in range(n-i):
+      pts.append(((i+1/3)/n,(j+1/3)/n))
+      if i + j < n-1:
+        pts.append(((i+2/3)/n,(j+2/3)/n))
+  return [utl.from_baricentric(ce[0],ce[1],ce[2],[u,v,1-u-v]) for u, v in pts]
+
+# run the shader walk on the sample grid (n x n) of every extrinsic triangle
+# return a dictionary of arrays, one entry per extrinsic triangle:
+# 'mean' and 'max' (number of visited triangles) and 'fail' (samples that exceed imax);
+# the entry 'imax' keeps the used limit
+def analyze (mesh, n=8, imax=IMAX):
+  mesh.repair_support()
+  nt = len(mesh.HE.T)
+  mean = np.zeros(nt,dtype='float64')
+  vmax = np.zeros(nt,dtype='int64')
+  fail = np.zeros(nt,dtype='int64')
+  for te in range(nt):
+    counts = []
+    for p in samples(mesh.te_flatten(te),n):
+      t, k = find_triangle(mesh,te,p,imax)
+      counts.append(k)
+      if t == -1:
+        fail[te] += 1
+    mean[te] = sum(counts) / len(counts)
+    vmax[te] = max(counts)
+  return {'mean': mean, 'max': vmax, 'fail': fail, 'imax': imax}
+
+# return a summary (dictionary) of the statistics computed by analyze
+def summary (stats):
+  mean = stats['mean']
+  vmax = stats['max']
+  fail = stats['fail']
+  return {
+    'triangles': len(mean),
+    'mean': float(np.mean(mean)) if len(mean) else 0.0,
+    'max': int(np.max(vmax)) if len(vmax) else 0,
+    'p99': float(np.percentile(vmax,99)) if len(vmax) else 0.0,
+    'failed_samples': int(np.sum(fail)),
+    'failed_triangles': int(np.count_nonzero(fail)),
+    'imax': stats['imax'],
+  }
+
+# print the summary of the statistics computed by analyze
+def print_summary (stats):
+  s = summary(stats)
+  print("extrinsic triangles:", s['triangles'])
+  print("visited triangles per fragment: mean %.2f, max %d (99th percentile of max %.1f)" %
+        (s['mean'],s['max'],s['p99']))
+  print("samples exceeding IMAX=%d: %d in %d extrinsic triangles" %
+        (s['imax'],s['failed_samples'],s['failed_triangles']))
+
+# clamp the cosine of an angle to [-1,1] (rounding of degenerate triangles)
+def clamp (c):
+  return max(-1.0,min(1.0,c))
@@ -0,0 +1,120 @@
+# walker: point location with coherent query hinting for intrinsic triangulations
+# Waldemar Celes
+# Tecgraf Institute of PUC-Rio
+# celes@tecgraf.puc-rio.br
+
+# This is an auxiliary class that locates points given in extrinsic triangles (as
+# te_point_location) and remembers the last located intrinsic triangle with its layout in
+# the 2d frame of the extrinsic triangle. A query in the same extrinsic triangle starts from
+# there, walking along the segment from the last point, instead of walking again from the
+# supporting halfedge; queries in other extrinsic triangles, and walks that fail (e.g. reach
+# the border), start from the supporting halfedge (see walk).
+# The hint is dropped when the mesh is modified (the walker observes the mesh).
+# The number of crossed edges of each query is reported.
+
+import math
+import numpy as np
+from . import utl
+
+MAX_STEPS = 1000  # maximum number of crossed edges of a hinted walk
+
+class Walker:
+  def __init__ (self, mesh):
+    self.mesh = mesh
+    self.te = -1            # extrinsic triangle of the last query
+    self.ce = None          # flattened extrinsic triangle of the last query
+    self.hint = None        # last located point and halfedge, with its layout: (q, h, v0, phi0)
+    self.steps = 0          # number of crossed edges of the last query
+    self.stats = {'queries': 0, 'hinted': 0, 'steps': 0, 'fallbacks': 0}
+    mesh.observers.append(self)
+
+  # drop the hint (the mesh was modified)
+  def touch (self, vlist):
+    self.hint = None
+
+  # drop the hint (entities were renumbered)
+  def reset (self):
+    self.hint = None
+
+  # locate a point given by its baricentric coordinates in an extrinsic triangle
+  # return the intrinsic halfedge of the containing triangle and the baricentric coordinates
+  # w.r.t. it (as te_point_location)
+  def locate (self, te, uvw):
+    mesh = self.mesh
+    mesh.repair_support()
+    if te != self.te:
+      self.te = te
+      self.ce = mesh.te_flatten(te)
+      self.hint = None
+    v = self.ce
+    p = utl.from_baricentric(v[0],v[1],v[2],uvw)
+    self.stats['queries'] += 1
+    res = None
+    if self.hint != None:
+      self.stats['hinted'] += 1
+      res = self.straight_walk(p,*self.hint)
+      if res == None:
+        self.stats['fallbacks'] += 1
+    if res == None:
+      h0, phi0 = mesh.te_support(te)
+      res = mesh.walk(p,h0,phi0)
+    h, uvw, v0, phi0, steps = res
+    self.hint = (p,h,v0,phi0)
+    self.steps = steps
+    self.stats['steps'] += steps
+    return h, uvw
+
+  # locate a sequence of points of the same extrinsic triangle (uvws: n x 3)
+  # return the intrinsic halfedges (n), the baricentric coordinates (n x 3) and the number of
+  # crossed edges of each query (n)
+  def locate_batch (self, te, uvws):
+    H = []
+    B = []
+    S = []
+    for uvw in np.asarray(uvws,dtype='float64').tolist():
+      h, b = self.locate(te,uvw)
+      H.append(h)
+      B.append(b)
+      S.append(self.steps)
+    return (np.array(H,dtype='int64'),np.array(B,dtype='float64').reshape(-1,3),
+            np.array(S,dtype='int64'))
+
+  # straight walk from the point q, in the triangle of halfedge h (with origin at v0 and angle
+  # phi0), to the triangle that contains p: as both points are in the same extrinsic triangle,
+  # the segment q-p does not leave the flat region of the extrinsic triangle
+  # return the same values as walk, or None if the walk fails
+  def straight_walk (self, p, q, h, v0, phi0):
+    mesh = self.mesh
+    entry = -1
+    for steps in range(MAX_STEPS):
+      v1, v2, phi1, phi2 = mesh.compute_flattern(v0,h,phi0)
+      hs = [h,mesh.next(h),mesh.previous(h)]
+      vs = [v0,v1,v2]
+      o = [utl.orient(vs[i],vs[(i+1)%3],p) for i in range(3)]
+      if min(o) >= 0:
+        area = utl.area(v0,v1,v2)
+        uvw = [utl.area(p,v1,v2)/area,utl.area(p,v2,v0)/area,0]
+        uvw[2] = 1 - uvw[0] - uvw[1]
+        return h, uvw, v0, phi0, steps
+      # exit edge: p is on its outer side and the segment q-p crosses it
+      k = -1
+      best = -math.inf
+      for i in range(3):
+        if hs[i] == entry or o[i] >= 0:
+          continue
+        c = utl.crossing_margin(vs[i],vs[(i+1)%3],q,p)
+        if c > best:
+          best = c
+          k = i
+      if k == -1:
+        return None
+      m = mesh.mate(hs[k])
+      if m == -1:
+        return None
+      a = vs[k]
+      b = vs[(k+1)%3]
+      h = m
+      v0 = b
+      phi0 = math.atan2(a[1]-b[1],a[0]-b[0])
+      entry = m
+    return None
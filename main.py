@@ -6,14 +6,16 @@
 from ds import he
 from ds import she
 from ds import utl
+from ds import meshio
+from ds import meshcache
 import numpy as np
 import math
 import time
 import sys
+import os
 
 import glfw
 from OpenGL.GL import *
-import potpourri3d as pp3d
 
 from sg import *
 
@@ -25,11 +27,16 @@ solution = None
 
 NC = 6       # number of colors
 AMIN = 25    # target minimum angle for refinement
+POLICY = 'circumcenter'   # Steiner point policy: 'circumcenter', 'offcenter' or 'sink'
+CACHE = os.environ.get('SHE_CACHE')  # cache directory of preprocessed meshes (optional)
 
 def load_mesh (filename):
-  V, F = pp3d.read_mesh(filename)
-  m = he.Mesh(V,F)
-  im = she.IntrinsicMesh(m, 1e-10)
+  if CACHE:
+    m, im = meshcache.MeshCache(CACHE).load(filename, she.IntrinsicMesh, 1e-10)
+  else:
+    V, F = meshio.read_mesh(filename)
+    m = he.Mesh(V,F)
+    im = she.IntrinsicMesh(m, 1e-10)
   im.print_info()
   return m,im
 
@@ -307,8 +314,9 @@ def keyboard (win, key, scancode, action, mods):
     print("begin chew93")
     im.delaunay()
     t0 = glfw.get_time()
-    im.chew93(AMIN*math.pi/180)  # set minimun angle goal
+    n = im.chew93(AMIN*math.pi/180,policy=POLICY)  # set minimun angle goal
     print("end chew93:", glfw.get_time() - t0)
+    print("inserted vertices:", n, "total:", len(im.V))
     im.check_consistency()
     im.print_info()
     E.SetData(np.array(im.E,dtype='int32'))